@@ -9,13 +9,19 @@ RAG System - 混合检索增强生成系统
 - utils: 工具模块（文本处理、分词）
 """
 
-from .core import RAGConfig
-from .rag_system import RAGSystem
+from .utils.lazy import lazy_exports
 
 __version__ = "1.0.0"
 
+# 访问时才导入对应子模块，import 本包不会加载 torch / chromadb / neo4j 等重量级依赖
+_EXPORTS = {
+    'RAGConfig': '.core',
+    'RAGSystem': '.rag_system',
+}
+
 __all__ = [
     'RAGConfig',
     'RAGSystem',
 ]
 
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
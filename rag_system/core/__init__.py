@@ -3,13 +3,37 @@
 提供配置、数据库和嵌入器功能
 """
 
-from .config import RAGConfig
-from .database import KnowledgeDatabase
-from .embedder import Embedder
+from ..utils.lazy import lazy_exports
+
+# chromadb 在创建 KnowledgeDatabase 时、torch 在创建 LocalEmbedder 时才导入
+_EXPORTS = {
+    'RAGConfig': '.config',
+    'KnowledgeDatabase': '.database',
+    'BM25Index': '.bm25_index',
+    'Embedder': '.embedder',
+    'EmbeddingCache': '.embedding_cache',
+    'LocalEmbedder': '.local_embedder',
+    'QuantizedVectorIndex': '.quantized_index',
+    'measure_recall': '.quantized_index',
+    'VectorIndex': '.vector_index',
+    'Hit': '.hits',
+    'LLMGateway': '.llm_gateway',
+    'LLMResponseCache': '.llm_gateway',
+}
 
 __all__ = [
     'RAGConfig',
     'KnowledgeDatabase',
+    'BM25Index',
     'Embedder',
+    'EmbeddingCache',
+    'LocalEmbedder',
+    'QuantizedVectorIndex',
+    'measure_recall',
+    'VectorIndex',
+    'Hit',
+    'LLMGateway',
+    'LLMResponseCache',
 ]
 
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
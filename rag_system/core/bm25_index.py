@@ -0,0 +1,494 @@
+"""
+BM25 关键词索引
+可增量维护的倒排索引：按来源文件增删文档的倒排项，同时维护文档频率和平均长度统计，
+打分公式与 rank_bm25.BM25Okapi 完全一致，因此增量结果与全量重建结果相同。
+查询时只访问查询词的倒排列表，用 NumPy 累加分数并用 argpartition 做 top-k 选择，
+耗时取决于倒排列表长度而不是语料规模。
+带来源过滤的查询通过 文档->来源编码 数组派生的来源位图，只对允许的文档打分。
+索引可以落盘（词表、CSR 倒排、文档长度、语料版本），启动时以 mmap 只读方式打开，
+多个进程共享同一份页缓存；首次增删文档时才展开为可变结构。
+分词通过 BatchTokenizer 批量完成，倒排表以整数 term id 为键，词表随索引一起落盘。
+增删文档与查询在同一把锁下读写倒排和统计，入库线程和检索线程可以同时使用同一个索引。
+"""
+import json
+import math
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from .hits import Hit
+from .index_store import corpus_version_of, current_dir, write_version
+from ..utils.smart_tokenize import BatchTokenizer, TokenVocabulary
+
+# 引入版本子目录之前的磁盘布局：文件直接位于索引目录下
+_LEGACY_FILES = ("indptr.npy", "postings.npy", "tf.npy", "doc_len.npy", "vocab.json", "meta.json")
+
+
+class BM25Index:
+    """增量 BM25 索引，文档以 Chroma 中的 id 标识"""
+
+    FORMAT_VERSION = 2
+
+    def __init__(self, language: str = "auto", k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                 tokenizer: BatchTokenizer | None = None):
+        self.language = language
+        self.tokenizer = tokenizer or BatchTokenizer()
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        # 文档槽位：删除后留空并复用，避免整体重排
+        self.doc_ids: List[str | None] = []
+        self.doc_sources: List[str | None] = []
+        self.doc_len: List[int] = []
+        self.doc_terms: List[Dict[int, int] | None] = []
+        self.id_to_slot: Dict[str, int] = {}
+        self.source_slots: Dict[str, set] = {}
+        self.source_codes: Dict[str, int] = {}  # 来源 -> 紧凑编码，只增不减
+        self._free_slots: List[int] = []
+
+        # 倒排表：term id -> {slot: tf}
+        self.postings: Dict[int, Dict[int, int]] = {}
+        self.total_len = 0
+
+        # 依赖全局统计的缓存，语料变化后惰性重算
+        self._idf = np.zeros(0)  # 按 term id 索引，df 为 0 的词为 0
+        self._norm = np.zeros(0)  # 每个槽位的 k1 * (1 - b + b * dl / avgdl)
+        self._doc_source_codes = np.zeros(0, dtype=np.int32)  # 每个槽位的来源编码，空槽位为 -1
+        self._source_masks: Dict[str, np.ndarray] = {}  # 来源 -> 槽位位图
+        self._stats_dirty = True
+        # 倒排列表的数组形式：term id -> (slots, tf)，对应词的倒排变化时失效
+        self._posting_arrays: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # 从磁盘加载的只读 CSR 倒排：(indptr, slots, tf)，行号即 term id；首次修改时展开到 postings
+        self._frozen = None
+        # 检索分支在线程池里并发查询，入库线程同时增删文档：倒排、统计和上面几项惰性缓存的读写都在这把锁下进行
+        self._lock = threading.RLock()
+        self._saved_version = None  # 与磁盘一致时为磁盘上的语料版本，任何增删后置空
+
+    def __len__(self):
+        return len(self.id_to_slot)
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / len(self) if len(self) else 0.0
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List[str], sources: List[str], language: str = "auto",
+              tokenizer: BatchTokenizer | None = None) -> "BM25Index":
+        """全量构建索引（用于初始化和校验增量结果）"""
+        index = cls(language=language, tokenizer=tokenizer)
+        index.add_documents(ids, documents, sources)
+        return index
+
+    # ================= 增量维护 =================
+
+    def add_documents(self, ids: List[str], documents: List[str], sources: List[str]):
+        """添加文档的倒排项；已存在的 id 会先被移除再重新加入"""
+        token_ids = self.tokenizer.tokenize_batch(list(documents), self.language)  # 分词较慢，不占用锁
+        with self._lock:
+            self._thaw()
+            for doc_id, tokens, source in zip(ids, token_ids, sources):
+                if doc_id in self.id_to_slot:
+                    self._remove_slot(self.id_to_slot[doc_id])
+                self._add_tokens(doc_id, tokens, source)
+            self._stats_dirty = True
+            self._saved_version = None
+
+    def remove_documents(self, ids: Iterable[str]):
+        """按 id 移除文档的倒排项"""
+        with self._lock:
+            self._thaw()
+            for doc_id in ids:
+                slot = self.id_to_slot.get(doc_id)
+                if slot is not None:
+                    self._remove_slot(slot)
+            self._stats_dirty = True
+            self._saved_version = None
+
+    def remove_source(self, source: str):
+        """移除某个来源文件的全部文档"""
+        with self._lock:
+            self._thaw()
+            for slot in list(self.source_slots.get(source, ())):
+                self._remove_slot(slot)
+            self._stats_dirty = True
+            self._saved_version = None
+
+    def _add_tokens(self, doc_id: str, tokens: np.ndarray, source: str):
+        terms, counts = np.unique(tokens, return_counts=True)
+        term_freqs = dict(zip(terms.tolist(), counts.tolist()))
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self.doc_ids[slot] = doc_id
+            self.doc_sources[slot] = source
+            self.doc_len[slot] = len(tokens)
+            self.doc_terms[slot] = term_freqs
+        else:
+            slot = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self.doc_sources.append(source)
+            self.doc_len.append(len(tokens))
+            self.doc_terms.append(term_freqs)
+
+        self.id_to_slot[doc_id] = slot
+        self.source_slots.setdefault(source, set()).add(slot)
+        self.source_codes.setdefault(source, len(self.source_codes))
+        self.total_len += len(tokens)
+        for term, tf in term_freqs.items():
+            self.postings.setdefault(term, {})[slot] = tf
+            self._posting_arrays.pop(term, None)
+
+    def _remove_slot(self, slot: int):
+        doc_id = self.doc_ids[slot]
+        source = self.doc_sources[slot]
+        for term in self.doc_terms[slot]:
+            self._posting_arrays.pop(term, None)
+            term_postings = self.postings[term]
+            del term_postings[slot]
+            if not term_postings:
+                del self.postings[term]  # 与全量重建保持一致：df 为 0 的词不参与 idf 统计
+
+        self.total_len -= self.doc_len[slot]
+        del self.id_to_slot[doc_id]
+        source_slots = self.source_slots[source]
+        source_slots.discard(slot)
+        if not source_slots:
+            del self.source_slots[source]
+
+        self.doc_ids[slot] = None
+        self.doc_sources[slot] = None
+        self.doc_len[slot] = 0
+        self.doc_terms[slot] = None
+        self._free_slots.append(slot)
+        self._source_masks = {}  # 槽位会被复用，旧位图不能再用
+
+    # ================= 打分 =================
+
+    def _refresh_stats(self):
+        """按 BM25Okapi 的方式重算 idf：负 idf 用 epsilon * 平均 idf 代替"""
+        if not self._stats_dirty:
+            return
+        with self._lock:
+            if not self._stats_dirty:
+                return
+            corpus_size = len(self)
+            df = np.zeros(len(self.tokenizer.vocab), dtype=np.float64)
+            if self._frozen is not None:
+                indptr = self._frozen[0]
+                df[:len(indptr) - 1] = np.diff(indptr)
+            elif self.postings:
+                terms = np.fromiter(self.postings.keys(), dtype=np.int64, count=len(self.postings))
+                df[terms] = [len(self.postings[t]) for t in terms.tolist()]
+            present = df > 0  # 与全量重建保持一致：只统计语料中出现的词
+            idf_all = np.zeros(len(df))
+            if present.any():
+                idf = np.log(corpus_size - df[present] + 0.5) - np.log(df[present] + 0.5)
+                eps = self.epsilon * float(idf.mean())
+                idf_all[present] = np.where(idf < 0, eps, idf)
+            doc_len = np.asarray(self.doc_len, dtype=np.float64)
+            norm = self.k1 * (1 - self.b + self.b * doc_len / (self.avgdl or 1.0))
+            doc_source_codes = np.fromiter(
+                (-1 if source is None else self.source_codes[source] for source in self.doc_sources),
+                dtype=np.int32, count=len(self.doc_sources)
+            )
+            # 算完再整体替换，并发查询不会读到算了一半的数组
+            self._idf, self._norm, self._doc_source_codes = idf_all, norm, doc_source_codes
+            self._source_masks = {}
+            self._stats_dirty = False
+
+    def idf(self, term: str) -> float:
+        self._refresh_stats()
+        term_id = self.tokenizer.vocab.term_ids.get(term)
+        return float(self._idf[term_id]) if term_id is not None and term_id < len(self._idf) else 0.0
+
+    def _get_posting_arrays(self, term: int):
+        if self._frozen is not None:
+            indptr, post_slots, post_tf = self._frozen
+            if term >= len(indptr) - 1 or indptr[term] == indptr[term + 1]:
+                return None
+            start, end = indptr[term], indptr[term + 1]
+            return post_slots[start:end], post_tf[start:end].astype(np.float64)
+        arrays = self._posting_arrays.get(term)
+        if arrays is None:
+            with self._lock:
+                arrays = self._posting_arrays.get(term)
+                if arrays is None:
+                    term_postings = self.postings.get(term)
+                    if not term_postings:
+                        return None
+                    slots = np.fromiter(term_postings.keys(), dtype=np.int64, count=len(term_postings))
+                    tf = np.fromiter(term_postings.values(), dtype=np.float64, count=len(term_postings))
+                    arrays = self._posting_arrays[term] = (slots, tf)
+        return arrays
+
+    def source_mask(self, source_filter) -> np.ndarray | None:
+        """
+        返回允许的槽位位图。
+        :param source_filter: 单个来源文件名、来源列表，或 None（不过滤）
+        """
+        if source_filter is None:
+            return None
+        self._refresh_stats()
+        sources = [source_filter] if isinstance(source_filter, str) else list(source_filter)
+        masks = []
+        for source in sources:
+            code = self.source_codes.get(source)
+            if code is None:
+                continue  # 未知来源不命中任何文档，也不缓存，避免任意来源名撑大缓存
+            mask = self._source_masks.get(source)
+            if mask is None:
+                with self._lock:
+                    mask = self._source_masks.get(source)
+                    if mask is None:
+                        mask = self._source_masks[source] = self._doc_source_codes == code
+            masks.append(mask)
+        if not masks:
+            return np.zeros(len(self._doc_source_codes), dtype=bool)
+        return masks[0] if len(masks) == 1 else np.logical_or.reduce(masks)
+
+    def score_sparse(self, tokens: List[int], source_filter=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        只在查询词的倒排列表上打分。
+        :param tokens: 查询的 term id 序列
+        :param source_filter: 只对这些来源的文档打分（idf 等统计仍基于全量语料）
+        :return: (slots, scores)，slots 升序且只包含至少命中一个查询词的文档
+        """
+        with self._lock:
+            return self._score_sparse(tokens, source_filter)
+
+    def _score_sparse(self, tokens: List[int], source_filter=None) -> Tuple[np.ndarray, np.ndarray]:
+        self._refresh_stats()
+        allowed = self.source_mask(source_filter)
+        slot_parts, score_parts = [], []
+        for token, count in Counter(tokens).items():  # 重复的查询词重复计分，与 BM25Okapi 一致
+            arrays = self._get_posting_arrays(token) if token < len(self._idf) else None
+            if arrays is None:
+                continue
+            slots, tf = arrays
+            if allowed is not None:
+                keep = allowed[slots]
+                slots, tf = slots[keep], tf[keep]
+                if not len(slots):
+                    continue
+            weight = self._idf[token] * count
+            slot_parts.append(slots)
+            score_parts.append(weight * (tf * (self.k1 + 1) / (tf + self._norm[slots])))
+
+        if not slot_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        if len(slot_parts) == 1:
+            order = np.argsort(slot_parts[0], kind="stable")
+            return slot_parts[0][order], score_parts[0][order]
+        unique_slots, inverse = np.unique(np.concatenate(slot_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts), minlength=len(unique_slots))
+        return unique_slots, scores
+
+    @staticmethod
+    def top_k(slots: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+        """部分选择出分数最高的 k 个槽位，按分数降序（同分按槽位升序）"""
+        return BM25Index.top_k_scored(slots, scores, k)[0]
+
+    @staticmethod
+    def top_k_scored(slots: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """同 top_k，同时返回对应的分数"""
+        if k <= 0 or not len(slots):
+            return slots[:0], scores[:0]
+        if len(slots) > k:
+            # argpartition 在第 k 名的同分项里任选，先保留所有不低于第 k 名分数的项，排序后再截断
+            kth = np.partition(-scores, k - 1)[k - 1]
+            candidates = np.flatnonzero(-scores <= kth)
+            slots, scores = slots[candidates], scores[candidates]
+        order = np.lexsort((slots, -scores))[:k]
+        return slots[order], scores[order]
+
+    def get_scores(self, tokens: List[int]) -> np.ndarray:
+        """返回每个槽位的 BM25 分数（空槽位为 0），与 BM25Okapi.get_scores 对应"""
+        with self._lock:
+            scores = np.zeros(len(self.doc_ids))
+            slots, sparse_scores = self.score_sparse(tokens)
+            scores[slots] = sparse_scores
+            return scores
+
+    def search_tokens(self, tokens: List[int], k: int = 5, source_filter=None) -> List[str]:
+        """对已编码为 term id 的查询返回分数最高的 k 个文档 id（只返回至少命中一个词的文档）"""
+        with self._lock:
+            return [self.doc_ids[s] for s in self._top_slots(tokens, k, source_filter)[0]]
+
+    def _top_slots(self, tokens: List[int], k: int, source_filter=None):
+        """返回 (槽位, 分数)，按分数降序"""
+        if not tokens or not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        slots, scores = self._score_sparse(tokens, source_filter)
+        return self.top_k_scored(slots, scores, k)
+
+    def search(self, query: str, k: int = 5, language: str | None = None, source_filter=None) -> List[str]:
+        """返回分数最高的 k 个文档 id"""
+        tokens = self.tokenizer.encode_query(query, language or self.language)
+        return self.search_tokens(tokens, k, source_filter)
+
+    def search_batch(self, queries: List[str], k: int = 5, language: str | None = None,
+                     source_filter=None) -> List[List[str]]:
+        """批量查询，共享一次统计刷新，结果与逐条 search 相同"""
+        self._refresh_stats()
+        return [self.search(query, k, language, source_filter) for query in queries]
+
+    def search_hits_batch(self, queries: List[str], k: int = 5, language: str | None = None,
+                          source_filter=None) -> List[List[Hit]]:
+        """批量查询，返回带 BM25 分数和来源的命中记录（分支名 keyword）"""
+        token_lists = [self.tokenizer.encode_query(query, language or self.language) for query in queries]
+        results = []
+        with self._lock:  # 整批查询看到同一份语料，不会与入库交错
+            self._refresh_stats()
+            for tokens in token_lists:
+                slots, scores = self._top_slots(tokens, k, source_filter)
+                slots = slots.tolist()
+                results.append(Hit.ranked("keyword", [self.doc_ids[s] for s in slots], scores.tolist(),
+                                          [self.doc_sources[s] for s in slots]))
+        return results
+
+    # ================= 持久化 =================
+
+    def _csr_arrays(self):
+        """把倒排表整理成 CSR 数组 (indptr, slots, tf)，行号即 term id"""
+        if self._frozen is not None:
+            return self._frozen
+        vocab_size = len(self.tokenizer.vocab)
+        lengths = np.zeros(vocab_size, dtype=np.int64)
+        for term, term_postings in self.postings.items():
+            lengths[term] = len(term_postings)
+        indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(lengths)
+        post_slots = np.empty(indptr[-1], dtype=np.int32)
+        post_tf = np.empty(indptr[-1], dtype=np.int32)
+        for term in self.postings:
+            slots, tf = self._get_posting_arrays(term)
+            order = np.argsort(slots)
+            post_slots[indptr[term]:indptr[term + 1]] = slots[order]
+            post_tf[indptr[term]:indptr[term + 1]] = tf[order]
+        return indptr, post_slots, post_tf
+
+    def save(self, path, corpus_version: str):
+        """
+        写入磁盘：写成一个新的版本子目录，再原子切换指针文件（见 index_store），正在 mmap 旧文件的进程不受影响。
+        每次都会完整序列化整个 CSR 倒排（耗时与语料规模成正比），因此索引自上次读写后没有改动、
+        且磁盘上已是同一语料版本时直接跳过。
+        内存中的文档集合与 corpus_version 不一致时（索引已偏离 Chroma）不写盘，避免把过期索引标记为最新。
+        :param corpus_version: 对应的 Chroma 语料版本，加载时用于判断是否过期
+        :return: 是否与磁盘一致（写入成功或无需写入）
+        """
+        with self._lock:
+            if self._saved_version == corpus_version and current_dir(path) is not None:
+                return True
+            if corpus_version_of(self.id_to_slot) != corpus_version:
+                print(f"[BM25] 索引文档集合与语料版本 {corpus_version} 不一致，跳过写盘（下次加载时将重建）")
+                return False
+            write_version(path, lambda version_dir: self._write_files(version_dir, corpus_version), _LEGACY_FILES)
+            self._saved_version = corpus_version
+            return True
+
+    def _write_files(self, path: Path, corpus_version: str):
+        indptr, post_slots, post_tf = self._csr_arrays()
+        terms = self.tokenizer.vocab.terms
+        np.save(path / "indptr.npy", indptr)
+        np.save(path / "postings.npy", post_slots)
+        np.save(path / "tf.npy", post_tf)
+        np.save(path / "doc_len.npy", np.asarray(self.doc_len, dtype=np.int32))
+        (path / "vocab.json").write_text(json.dumps(terms, ensure_ascii=False), encoding="utf-8")
+        meta = {
+            "format_version": self.FORMAT_VERSION,
+            "corpus_version": corpus_version,
+            "language": self.language,
+            "k1": self.k1, "b": self.b, "epsilon": self.epsilon,
+            "doc_ids": self.doc_ids,
+            "doc_sources": self.doc_sources,
+            "source_codes": self.source_codes,
+        }
+        (path / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    @staticmethod
+    def read_corpus_version(path) -> str | None:
+        """读取磁盘索引对应的语料版本，不存在或格式不符时返回 None"""
+        current = current_dir(path)
+        if current is None:
+            return None
+        try:
+            meta = json.loads((current / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        if meta.get("format_version") != BM25Index.FORMAT_VERSION:
+            return None
+        return meta.get("corpus_version")
+
+    @classmethod
+    def load(cls, path, mmap: bool = True, tokenize_workers: int | None = None) -> "BM25Index":
+        """从磁盘打开索引；倒排数组以 mmap 只读方式映射，不重新分词"""
+        path = current_dir(path)
+        if path is None:
+            raise FileNotFoundError("BM25 索引不存在")
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        mmap_mode = "r" if mmap else None
+        terms = json.loads((path / "vocab.json").read_text(encoding="utf-8"))
+        tokenizer = BatchTokenizer(TokenVocabulary(terms), workers=tokenize_workers)
+        index = cls(language=meta["language"], k1=meta["k1"], b=meta["b"], epsilon=meta["epsilon"],
+                    tokenizer=tokenizer)
+
+        index._frozen = (
+            np.load(path / "indptr.npy", mmap_mode=mmap_mode),
+            np.load(path / "postings.npy", mmap_mode=mmap_mode),
+            np.load(path / "tf.npy", mmap_mode=mmap_mode),
+        )
+        index.doc_ids = meta["doc_ids"]
+        index.doc_sources = meta["doc_sources"]
+        index.doc_len = np.load(path / "doc_len.npy").tolist()
+        index.source_codes = meta["source_codes"]
+        index.total_len = sum(index.doc_len)
+        for slot, (doc_id, source) in enumerate(zip(index.doc_ids, index.doc_sources)):
+            if doc_id is None:
+                index._free_slots.append(slot)
+            else:
+                index.id_to_slot[doc_id] = slot
+        index.doc_terms = [None] * len(index.doc_ids)
+        index._saved_version = meta["corpus_version"]
+        return index
+
+    def _thaw(self):
+        """把只读 CSR 倒排展开为可增量维护的字典结构（无需重新分词）"""
+        if self._frozen is None:
+            return
+        indptr, post_slots, post_tf = self._frozen
+        self._frozen = None
+        self.postings = {}
+        self.doc_terms = [None if doc_id is None else {} for doc_id in self.doc_ids]
+        for term in np.flatnonzero(np.diff(indptr)).tolist():
+            start, end = int(indptr[term]), int(indptr[term + 1])
+            term_postings = dict(zip(post_slots[start:end].tolist(), post_tf[start:end].tolist()))
+            self.postings[term] = term_postings
+            for slot, tf in term_postings.items():
+                self.doc_terms[slot][term] = tf
+        self.source_slots = {}
+        for slot, source in enumerate(self.doc_sources):
+            if self.doc_ids[slot] is not None:
+                self.source_slots.setdefault(source, set()).add(slot)
+        self._posting_arrays = {}
+        self._stats_dirty = True
+
+    def score_documents(self, query: str) -> Dict[str, float]:
+        """返回 {文档id: 分数}，用于与全量重建的结果比对"""
+        tokens = self.tokenizer.encode_query(query, self.language)
+        with self._lock:
+            scores = self.get_scores(tokens)
+            return {doc_id: float(scores[slot]) for doc_id, slot in self.id_to_slot.items()}
+
+    def matches(self, other: "BM25Index", queries: List[str], tol: float = 1e-9) -> bool:
+        """检查两个索引对给定查询的打分是否一致"""
+        for query in queries:
+            mine, theirs = self.score_documents(query), other.score_documents(query)
+            if mine.keys() != theirs.keys():
+                return False
+            if any(not math.isclose(mine[d], theirs[d], rel_tol=tol, abs_tol=tol) for d in mine):
+                return False
+        return True
@@ -1,17 +1,57 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import os
-from typing import Dict
+from typing import Dict, List
 
 @dataclass
 class RAGConfig:
-    embedding_model_name: str = "gemini-embedding-001"
+    embedding_model_name: str = "gemini-embedding-001"  # local 后端时为 sentence-transformers 模型名或本地路径
+    embedding_backend: str = "gemini"  # gemini: 调用 Gemini API；local: 本地 CPU 推理
     reranker_model_name: str = "BAAI/bge-reranker-base"
+    reranker_backend: str = "torch"  # torch: PyTorch 全精度；onnx: 导出为 int8 量化 ONNX（失败时回退 torch）
+    reranker_threads: int | None = None  # ONNX 重排的 intra-op 线程数
+    reranker_max_length: int | None = None  # 重排输入截断长度，None 表示使用模型默认值
+    reranker_onnx_quantization: str = "avx512_vnni"  # ONNX 量化配置：arm64 / avx2 / avx512 / avx512_vnni
+    rerank_batch_size: int = 32  # 交叉编码器单次前向的 (query, doc) 对数
+    rerank_candidate_budget: int | None = None  # 级联重排：交叉编码器最多打分的候选数，None 表示全部打分
+    rerank_first_stage_model: str | None = None  # 级联第一阶段的小型交叉编码器，None 时按 RRF 融合顺序截断
+    rerank_early_exit_patience: int | None = None  # top_n 连续多少批不变时提前结束重排，None 表示不提前退出
+    rerank_micro_batch: bool = False  # 是否把并发查询的重排请求汇集成微批（多线程服务场景）
+    rerank_max_batch_size: int = 64  # 微批最多汇集的 (query, doc) 对数
+    rerank_max_wait_ms: float = 5.0  # 微批收集窗口（毫秒）
     llm_model_name: str = "deepseek-chat"
     db_path: str = "./chroma_db"
     knowledgebase_path: str = "./Knowledgebase"
     verbose: bool = True
+    lazy_init: bool = True  # 组件和索引在首次使用时才创建；False 时在构造 RAGSystem 时全部预热
     neo4j_uri: str = "bolt://localhost:7687"  # Neo4j 连接地址
     neo4j_auth: tuple[str, str] = ("neo4j", "123456qq") # 需要自己改成对应的密码
+    graph_extraction_workers: int = 1  # 图谱抽取时并行调用 LLM 的 chunk 数；默认逐个处理，每个 chunk 都能看到之前 chunk 写入的实体，>1 时并行的 chunk 互相看不到新实体
+    graph_candidate_entities: int | None = 50  # 结构化提示词中最多列出的已有实体数（按 n-gram 相似度挑选），None 表示全部列出
+    tokenize_workers: int | None = None  # BM25 建索引时的分词进程数，None 表示使用 CPU 核数
+    embedding_cache: bool = True  # 是否缓存嵌入向量（存放在 db_path 下）
+    embedding_cache_memory_mb: int = 256  # 内存 LRU 中向量数据的上限（MB），按 float32 计算
+    embedding_cache_max_entries: int = 500_000  # 磁盘缓存条目上限
+    llm_cache: bool = True  # 是否允许缓存 temperature=0 的 LLM 响应（存放在 db_path 下），有采样随机性的调用不缓存
+    llm_cache_components: List[str] | None = field(default_factory=list)  # 按组件开启缓存，如 ["entity_extractor", "graph_processor"]；默认为空即不缓存，None 表示全部
+    llm_cache_ttl: float | None = None  # LLM 响应缓存有效期（秒），None 表示永不过期
+    llm_cache_max_entries: int = 100_000  # LLM 响应缓存条目上限
+    embedding_batch_size: int = 100  # 入库时每次嵌入请求的文本数
+    embedding_concurrency: int = 4  # 入库时同时在途的嵌入请求数
+    embedding_rate_limit: float | None = None  # 嵌入请求速率上限（次/秒），None 表示不限
+    embedding_max_retries: int = 5  # 限流/临时错误的最大重试次数
+    local_embedding_threads: int | None = None  # local 后端的 torch 线程数
+    local_embedding_quantize: bool = False  # local 后端是否使用 int8 动态量化
+    local_embedding_batch_chars: int = 16_384  # local 后端动态组批的字符预算
+    embedding_dim: int | None = None  # Matryoshka 截断维度（截断后重新归一化），None 表示完整维度
+    vector_quantization: str | None = None  # 量化副本用于粗排：None / "int8" / "binary"
+    rescore_multiplier: int = 4  # 粗排取 k * rescore_multiplier 个候选做全精度重排
+    vector_backend: str = "chroma"  # 向量检索后端：chroma / numpy（mmap 精确索引，Chroma 仍为权威存储）
+    retrieval_workers: int = 4  # 并行执行检索分支的线程数
+    retrieval_leg_timeout: float | None = None  # 检索分支的截止时间（秒），超时分支被丢弃；None 表示不限
+    generation_concurrency: int = 8  # query_batch 中同时进行的图谱查询/生成调用数
+    fusion_weights: Dict[str, float] | None = None  # 融合时各检索分支的权重，如 {"vector": 1.0, "keyword": 0.5}
+    rrf_k: int = 60  # RRF 平滑参数
+    fusion_top_k: int | None = None  # 融合后只取前 N 个候选取回文本并送入重排，None 表示全部
 
     @property
     def gemini_api_key(self):
@@ -1,14 +1,66 @@
-import chromadb
-from rank_bm25 import BM25Okapi
-from ..utils.smart_tokenize import smart_tokenize
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from .bm25_index import BM25Index
+from .hits import Hit
+from .index_store import corpus_version_of
+from .quantized_index import QuantizedVectorIndex
+from .vector_index import VectorIndex
+from ..utils.smart_tokenize import BatchTokenizer
+
+
+def _lazy_index(name):
+    """派生索引属性：第一次访问时才打开（或重建）全部索引"""
+    private = f"_{name}"
+
+    def getter(self):
+        if not self._indexes_loaded:
+            self.ensure_indexes()
+        return getattr(self, private)
+
+    def setter(self, value):
+        setattr(self, private, value)
+
+    return property(getter, setter)
+
 
 class KnowledgeDatabase:
-    def __init__(self, db_path, collection_name, verbose=True):
+    bm25_index = _lazy_index("bm25_index")
+    quantized_index = _lazy_index("quantized_index")
+    vector_index = _lazy_index("vector_index")
+
+    def __init__(self, db_path, collection_name, verbose=True, tokenize_workers=None,
+                 vector_quantization=None, rescore_multiplier=4, vector_backend="chroma"):
         self.verbose = verbose
+        self.tokenize_workers = tokenize_workers
+        # 共享的批量分词器：带内容哈希缓存，重建索引时未变化的文本不会重复分词
+        self.tokenizer = BatchTokenizer(workers=tokenize_workers)
+        import chromadb
         self.chroma_client = chromadb.PersistentClient(path=db_path)
         self.collection = self.chroma_client.get_or_create_collection(name=collection_name)
+        self._indexes_loaded = False  # 派生索引在首次使用时由 load_indexes 打开，全部加载成功后才置为 True
+        self._index_lock = threading.RLock()  # 并行的检索分支可能同时触发首次加载
+        self._loading = False  # 加载过程中（持锁线程内）访问索引属性时直接返回当前值，避免递归加载
         self.bm25_index = None
-        self.bm25_corpus = []
+        # BM25 索引与 Chroma 数据放在一起，每个 collection 一份
+        self.bm25_path = Path(db_path) / "bm25" / collection_name
+        # 可选的量化向量副本：粗排用量化向量，再取 rescore_multiplier * k 个候选做全精度重排
+        self.vector_quantization = vector_quantization
+        self.rescore_multiplier = rescore_multiplier
+        self.quantized_index = None
+        self.quantized_path = Path(db_path) / "quantized" / collection_name
+        # vector_backend="numpy" 时在 Chroma 之外维护一份 mmap 的精确向量索引用于检索
+        if vector_backend not in ("chroma", "numpy"):
+            raise ValueError(f"未知的 vector_backend: {vector_backend}")
+        self.vector_backend = vector_backend
+        self.vector_index = None
+        self.vector_index_path = Path(db_path) / "vectors" / collection_name
+        # 每个来源文件的清单：按顺序的 chunk id 与文档级实体映射，用于增量更新
+        self.manifest_path = Path(db_path) / "manifests" / f"{collection_name}.json"
+        self._manifests = None
 
     def get_all_sources(self):
         """获取数据库中所有文档来源"""
@@ -18,7 +70,7 @@ class KnowledgeDatabase:
             if metadata and "source" in metadata:
                 sources.add(metadata["source"])
         return list(sources)
-    
+
     def get_stats(self):
         """获取数据库统计信息"""
         all_data = self.collection.get(include=["metadatas"])
@@ -30,20 +82,299 @@ class KnowledgeDatabase:
             "source_count": len(sources)
         }
 
+    def get_documents(self, ids):
+        """按 id 取回文本，保持传入顺序"""
+        return self.get_documents_batch([ids])[0]
+
+    def get_documents_batch(self, id_lists):
+        """一次 Chroma 调用取回多组 id 的文本，保持每组的顺序"""
+        by_id = dict(zip(*self._fetch_documents({i for ids in id_lists for i in ids})))
+        return [[by_id[i] for i in ids if i in by_id] for ids in id_lists]
+
+    # ================= 向量检索 =================
+
+    def vector_search(self, query_embeddings, k=5, source_filter=None):
+        """批量向量检索，返回每个查询的文本列表"""
+        hit_lists = self.attach_texts(self.vector_search_hits(query_embeddings, k, source_filter))
+        return [[hit.text for hit in hits] for hits in hit_lists]
+
+    def vector_search_hits(self, query_embeddings, k=5, source_filter=None):
+        """
+        批量向量检索，返回每个查询的命中记录（分支名 vector，分数为负的平方 L2 距离，不含文本）。
+        优先级：量化粗排+重排 > NumPy 精确索引 > Chroma 查询。
+        """
+        if self.quantized_index is not None:
+            hit_lists = []
+            for e in query_embeddings:
+                ids, distances = self.quantized_search(e, k, source_filter, with_distances=True)
+                hit_lists.append(Hit.ranked("vector", ids, [-d for d in distances],
+                                            self.quantized_index.sources_of(ids)))
+            return hit_lists
+        if self.vector_index is not None:
+            id_lists, distance_lists = self.vector_index.search(query_embeddings, k, source_filter,
+                                                                with_distances=True)
+            return [Hit.ranked("vector", ids, [-d for d in distances], self.vector_index.sources_of(ids))
+                    for ids, distances in zip(id_lists, distance_lists)]
+        results = self.collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=k,
+            where={"source": source_filter} if source_filter else None,
+            include=["metadatas", "distances"],
+        )
+        return [Hit.ranked("vector", ids, [-d for d in distances], [(m or {}).get("source") for m in metadatas])
+                for ids, distances, metadatas in zip(results["ids"], results["distances"], results["metadatas"])]
+
+    def attach_texts(self, hit_lists):
+        """一次 Chroma 调用为尚无文本的命中取回文本；取不到文本的命中被丢弃"""
+        missing = {hit.id for hits in hit_lists for hit in hits if hit.text is None}
+        by_id = dict(zip(*self._fetch_documents(missing)))
+        for hits in hit_lists:
+            for hit in hits:
+                if hit.text is None:
+                    hit.text = by_id.get(hit.id)
+        return [[hit for hit in hits if hit.text is not None] for hits in hit_lists]
+
+    def _fetch_documents(self, ids):
+        if not ids:
+            return [], []
+        results = self.collection.get(ids=list(ids), include=["documents"])
+        return results["ids"], results["documents"]
+
+    # ================= 写入（同步维护 BM25 / 向量索引） =================
+
+    def add_documents(self, ids, documents, embeddings, metadatas):
+        """写入 Chroma，并把新文档增量加入 BM25 索引和向量索引"""
+        self.ensure_indexes()  # 先按写入前的语料版本打开索引，再做增量更新
+        self.collection.add(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+        sources = [m.get("source") for m in metadatas]
+        if self.bm25_index is None:
+            self.bm25_index = BM25Index(tokenizer=self.tokenizer)
+        self.bm25_index.add_documents(ids, documents, sources)
+        if self.vector_quantization:
+            if self.quantized_index is None:
+                self.quantized_index = QuantizedVectorIndex(self.vector_quantization)
+            self.quantized_index.add(ids, embeddings, sources)
+        if self.vector_backend == "numpy":
+            if self.vector_index is None:
+                self.vector_index = VectorIndex()
+            self.vector_index.add(ids, embeddings, sources)
+
+    def delete_documents(self, ids):
+        """按 chunk id 删除文档，并从各派生索引中移除"""
+        ids = list(ids)
+        if not ids:
+            return
+        self.ensure_indexes()
+        self.collection.delete(ids=ids)
+        if self.bm25_index is not None:
+            self.bm25_index.remove_documents(ids)
+        if self.quantized_index is not None:
+            self.quantized_index.remove_ids(ids)
+        if self.vector_index is not None:
+            self.vector_index.remove_ids(ids)
+
+    def delete_source(self, source):
+        """删除某个来源文件的全部文档，并从 BM25 索引中移除其倒排项"""
+        self.ensure_indexes()
+        results = self.collection.get(where={"source": source}, include=[])
+        ids = results["ids"]
+        if ids:
+            self.collection.delete(ids=ids)
+        if self.bm25_index is not None:
+            self.bm25_index.remove_source(source)
+        if self.quantized_index is not None:
+            self.quantized_index.remove_source(source)
+        if self.vector_index is not None:
+            self.vector_index.remove_source(source)
+        return ids
+
+    def corpus_version(self):
+        """Chroma collection 当前内容的版本号：由全部文档 id 计算，不读取文本"""
+        return corpus_version_of(self.collection.get(include=[])["ids"])
+
+    # ================= 内容寻址的 chunk id 与来源清单 =================
+
+    @staticmethod
+    def chunk_ids(source, chunks):
+        """
+        内容寻址的 chunk id：f"{source}_{内容哈希}"，插入或删除段落不会改变其他 chunk 的 id。
+        同一文件中内容完全相同的 chunk 只保留第一个。
+        :return: (ids, chunks) 去重后一一对应
+        """
+        ids, kept = [], []
+        seen = set()
+        for chunk in chunks:
+            chunk_id = f"{source}_{hashlib.sha1(chunk.encode('utf-8')).hexdigest()[:16]}"
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                ids.append(chunk_id)
+                kept.append(chunk)
+        return ids, kept
+
+    @property
+    def manifests(self) -> dict:
+        """{source: {"chunks": [chunk id], "entities": {实体名: 规范化ID}}}"""
+        if self._manifests is None:
+            try:
+                self._manifests = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                self._manifests = {}
+        return self._manifests
+
+    def get_manifest(self, source):
+        """某个来源的清单；旧版本入库（没有清单）的来源返回 None"""
+        return self.manifests.get(source)
+
+    def set_manifest(self, source, chunk_ids, entities=None):
+        self.manifests[source] = {"chunks": list(chunk_ids), "entities": entities or {}}
+        self._save_manifests()
+
+    def drop_manifest(self, source):
+        if self.manifests.pop(source, None) is not None:
+            self._save_manifests()
+
+    def _save_manifests(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_name(f"{self.manifest_path.name}.tmp-{os.getpid()}")
+        tmp_path.write_text(json.dumps(self._manifests, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.manifest_path)
+
+    # ================= 索引持久化 =================
+
+    def ensure_indexes(self):
+        """确保派生索引已打开（幂等、线程安全：其他线程等待首次加载完成）"""
+        if not self._indexes_loaded:
+            with self._index_lock:
+                if not self._indexes_loaded and not self._loading:
+                    self.load_indexes()
+
+    def load_indexes(self, language="auto"):
+        """打开全部派生索引（BM25、量化向量、精确向量），只计算一次语料版本；失败时下次访问会重试"""
+        with self._index_lock:
+            self._loading = True
+            try:
+                version = self.corpus_version()
+                self.load_bm25(language, version)
+                if self.vector_backend == "numpy":
+                    self.load_vector_index(version)
+                if self.vector_quantization:
+                    self.load_quantized_index(version)
+            finally:
+                self._loading = False
+            self._indexes_loaded = True
+
+    def save_indexes(self):
+        """把全部派生索引写盘（从未打开过的索引没有改动，无需写盘）"""
+        if not self._indexes_loaded:
+            return
+        version = self.corpus_version()
+        self.save_bm25(version)
+        if self.quantized_index is not None:
+            self.quantized_index.save(self.quantized_path, version)
+        if self.vector_index is not None:
+            self.vector_index.save(self.vector_index_path, version)
+
+    def load_bm25(self, language="auto", version=None):
+        """打开磁盘上的 BM25 索引；不存在或与 Chroma 版本不一致时全量重建并写盘"""
+        version = version or self.corpus_version()
+        if BM25Index.read_corpus_version(self.bm25_path) == version:
+            try:
+                index = BM25Index.load(self.bm25_path, tokenize_workers=self.tokenize_workers)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[BM25] 读取磁盘索引失败: {e}，将重新构建")
+            else:
+                if index.language == language:
+                    self.bm25_index = index
+                    self.tokenizer = index.tokenizer  # 沿用磁盘上的词表，保证 term id 一致
+                    if self.verbose:
+                        print(f"[BM25] 已从磁盘加载索引 ({len(index)} 文档)")
+                    return
+        self.rebuild_bm25(language)
+        self.save_bm25(version)
+
+    def save_bm25(self, version=None):
+        """把当前 BM25 索引写盘，记录对应的语料版本"""
+        if self.bm25_index is None:
+            return
+        self.bm25_index.save(self.bm25_path, version or self.corpus_version())
+
+    def _load_all_embeddings(self):
+        """优先从已加载的精确向量索引取全量向量，否则从 Chroma 读取"""
+        if self.vector_index is not None and len(self.vector_index):
+            return self.vector_index.ids, self.vector_index.vectors, self.vector_index.sources
+        all_docs = self.collection.get(include=["embeddings", "metadatas"])
+        return all_docs["ids"], all_docs["embeddings"], [(m or {}).get("source") for m in all_docs["metadatas"]]
+
+    def load_vector_index(self, version=None):
+        """以 mmap 打开磁盘上的精确向量索引；版本不一致时从 Chroma 重建"""
+        version = version or self.corpus_version()
+        index = VectorIndex.load(self.vector_index_path, version)
+        if index is None:
+            all_docs = self.collection.get(include=["embeddings", "metadatas"])
+            index = VectorIndex()
+            index.add(all_docs["ids"], all_docs["embeddings"], [(m or {}).get("source") for m in all_docs["metadatas"]])
+            index.save(self.vector_index_path, version)
+            if self.verbose:
+                print(f"[向量索引] 已从 Chroma 重建 ({len(index)} 文档)")
+        elif self.verbose:
+            print(f"[向量索引] 已从磁盘加载 ({len(index)} 文档)")
+        self.vector_index = index
+
+    def load_quantized_index(self, version=None):
+        """打开磁盘上的量化索引；版本不一致时从全精度向量重建"""
+        version = version or self.corpus_version()
+        index = QuantizedVectorIndex.load(self.quantized_path, self.vector_quantization, version)
+        if index is None:
+            index = QuantizedVectorIndex(self.vector_quantization)
+            index.add(*self._load_all_embeddings())
+            index.save(self.quantized_path, version)
+            if self.verbose:
+                print(f"[量化索引] 已重建 ({len(index)} 文档, {self.vector_quantization})")
+        elif self.verbose:
+            print(f"[量化索引] 已从磁盘加载 ({len(index)} 文档, {self.vector_quantization})")
+        self.quantized_index = index
+
+    def quantized_search(self, query_embedding, k=5, source_filter=None, with_distances=False):
+        """量化粗排 + 全精度重排，返回文档 id（with_distances 时返回 (id 列表, 距离列表)）"""
+        candidate_ids = self.quantized_index.candidates(query_embedding, k * self.rescore_multiplier, source_filter)
+        if not candidate_ids:
+            return ([], []) if with_distances else []
+        if self.vector_index is not None:
+            found_ids, vectors = self.vector_index.get_vectors(candidate_ids)
+            return QuantizedVectorIndex.rescore(query_embedding, found_ids, vectors, k, with_distances)
+        fetched = self.collection.get(ids=candidate_ids, include=["embeddings"])
+        return QuantizedVectorIndex.rescore(query_embedding, fetched["ids"], fetched["embeddings"], k,
+                                            with_distances)
+
+    # ================= BM25 全量构建 / 校验 =================
+
+    def _build_bm25_from_collection(self, language="auto", tokenizer=None):
+        all_docs = self.collection.get(include=["documents", "metadatas"])
+        sources = [(m or {}).get("source") for m in all_docs["metadatas"]]
+        return BM25Index.build(all_docs["ids"], all_docs["documents"], sources,
+                               language=language, tokenizer=tokenizer)
+
     def rebuild_bm25(self, language="auto"):
-        all_docs = self.collection.get(include=["documents"])
-        self.bm25_corpus = all_docs["documents"]
-        if not self.bm25_corpus:
-            self.bm25_index = None
+        """从 Chroma 全量重建 BM25 索引"""
+        index = self.bm25_index = self._build_bm25_from_collection(language, self.tokenizer)
+        if not len(index):
             if self.verbose:
                 print("BM25 索引为空")
             return
-        tokenized = [smart_tokenize(doc, language) for doc in self.bm25_corpus]
-        self.bm25_index = BM25Okapi(tokenized)
         if self.verbose:
             stats = self.get_stats()
             print(f"[数据库状态]")
             print(f"   - 文档总数: {stats['total_documents']}")
             print(f"   - 来源文件数: {stats['source_count']}")
             print(f"   - 文件列表: {', '.join(stats['sources']) if stats['sources'] else '无'}")
-            print(f"   - BM25 索引: 已构建 ({len(self.bm25_corpus)} 文档)")
\ No newline at end of file
+            print(f"   - BM25 索引: 已构建 ({len(index)} 文档)")
+
+    def verify_bm25(self, queries, language="auto"):
+        """用全量重建的索引校验增量索引的打分是否一致"""
+        # 使用独立的分词器（无缓存、独立词表），保证校验结果不依赖增量状态
+        reference = self._build_bm25_from_collection(language, BatchTokenizer(workers=self.tokenize_workers))
+        current = self.bm25_index if self.bm25_index is not None else BM25Index(language=language)
+        ok = current.matches(reference, queries)
+        if self.verbose:
+            print(f"[BM25 校验] 增量索引与全量重建{'一致' if ok else '不一致'}")
+        return ok
@@ -1,14 +1,130 @@
-from google import genai
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .embedding_cache import EmbeddingCache
+from .quantized_index import truncate_embeddings
+from ..utils.lazy import LoopLocal, resolve
+from ..utils.rate_limit import TokenBucket, acall_with_backoff, call_with_backoff
 
 class Embedder:
-    def __init__(self, client, model: str):
+    def __init__(self, client, model: str, cache: EmbeddingCache | None = None,
+                 rate_limiter: TokenBucket | None = None, max_retries: int = 5, output_dim: int | None = None,
+                 async_client=None):
+        """
+        :param output_dim: Matryoshka 截断维度，None 表示使用模型的完整维度
+        :param async_client: aembed 使用的 genai 异步客户端（可以是 LoopLocal），None 时使用 client.aio
+        """
         self.client = client
+        self._async_client = async_client
         self.model = model
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.output_dim = output_dim
+        # 缓存键里区分截断维度，避免不同维度的向量互相命中
+        self._cache_model = f"{model}@{output_dim}" if output_dim else model
 
     def embed(self, texts, task_type):
+        """嵌入文本；命中缓存的文本不再请求 API，未命中的合并成一次调用"""
+        if self.cache is None:
+            return self._request_truncated(texts, task_type)
+        keys, found, missing = self._lookup(texts, task_type)
+        if missing:
+            self._store(found, missing, self._request_truncated(list(missing.values()), task_type))
+        return self._vectors(found, keys)
+
+    async def aembed(self, texts, task_type):
+        """embed 的协程版本，走异步客户端，不占用线程"""
+        if self.cache is None:
+            return await self._arequest_truncated(texts, task_type)
+        # 缓存读写是同步的 SQLite 操作，放到线程里执行，避免阻塞事件循环
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts, task_type)
+        if missing:
+            vectors = await self._arequest_truncated(list(missing.values()), task_type)
+            await asyncio.to_thread(self._store, found, missing, vectors)
+        return self._vectors(found, keys)
+
+    async def aclose(self):
+        """关闭当前事件循环的异步客户端（只关闭按事件循环创建的客户端）"""
+        if isinstance(self._async_client, LoopLocal):
+            client = self._async_client.pop()
+            if client is not None and hasattr(client, "aclose"):
+                await client.aclose()
+
+    def _lookup(self, texts, task_type):
+        keys = [EmbeddingCache.make_key(self._cache_model, task_type, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = {}  # key -> text，同一批次内的重复文本只请求一次
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        return keys, found, missing
+
+    def _store(self, found, missing, vectors):
+        new_items = dict(zip(missing.keys(), vectors))
+        self.cache.put_many(new_items)
+        found.update(new_items)
+
+    @staticmethod
+    def _vectors(found, keys):
+        """缓存里是 float32 数组，对外（Chroma 等）仍返回 List[float]，只在这里转换一次"""
+        return [v.tolist() if isinstance(v, np.ndarray) else v for v in (found[key] for key in keys)]
+
+    def embed_batches(self, batches, task_type, max_concurrency=4):
+        """
+        并发嵌入多个批次，最多 max_concurrency 个批次同时在途。
+        按输入顺序逐个产出 (批次序号, 向量列表)，调用方处理当前批次时后续批次仍在嵌入。
+        """
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            in_flight = deque()
+            batch_iter = enumerate(batches)
+            for i, batch in batch_iter:
+                in_flight.append((i, pool.submit(self.embed, batch, task_type)))
+                if len(in_flight) >= max_concurrency:
+                    break
+            while in_flight:
+                i, future = in_flight.popleft()
+                embeddings = future.result()
+                next_batch = next(batch_iter, None)
+                if next_batch is not None:
+                    j, batch = next_batch
+                    in_flight.append((j, pool.submit(self.embed, batch, task_type)))
+                yield i, embeddings
+
+    def _request_truncated(self, texts, task_type):
+        return truncate_embeddings(self._request(texts, task_type), self.output_dim)
+
+    async def _arequest_truncated(self, texts, task_type):
+        return truncate_embeddings(await self._arequest(texts, task_type), self.output_dim)
+
+    def _request(self, texts, task_type):
+        """带限流和退避重试的 API 调用"""
+        return call_with_backoff(lambda: self._embed_uncached(texts, task_type),
+                                 max_retries=self.max_retries, rate_limiter=self.rate_limiter)
+
+    async def _arequest(self, texts, task_type):
+        return await acall_with_backoff(lambda: self._aembed_uncached(texts, task_type),
+                                        max_retries=self.max_retries, rate_limiter=self.rate_limiter)
+
+    def _embed_uncached(self, texts, task_type):
+        from google import genai
         resp = self.client.models.embed_content(
             model=self.model,
             contents=texts,
-            config=genai.types.EmbedContentConfig(task_type=task_type)
+            config=genai.types.EmbedContentConfig(task_type=task_type, output_dimensionality=self.output_dim)
+        )
+        return [d.values for d in resp.embeddings]
+
+
+    async def _aembed_uncached(self, texts, task_type):
+        from google import genai
+        client = resolve(self._async_client) if self._async_client is not None else self.client.aio
+        resp = await client.models.embed_content(
+            model=self.model,
+            contents=texts,
+            config=genai.types.EmbedContentConfig(task_type=task_type, output_dimensionality=self.output_dim)
         )
-        return [d.values for d in resp.embeddings]
\ No newline at end of file
+        return [d.values for d in resp.embeddings]
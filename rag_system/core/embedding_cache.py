@@ -0,0 +1,153 @@
+"""
+嵌入向量缓存
+以 (模型, task_type, 文本哈希) 为键，内存 LRU + SQLite 磁盘两级缓存，
+命中时完全跳过嵌入 API 调用。向量在两级缓存中都以 float32 存放，内存层按字节数限制大小。
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """两级嵌入缓存：内存 LRU 在前，SQLite 在后"""
+
+    def __init__(self, path=None, memory_bytes: int = 256 * 1024 * 1024, max_entries: int = 500_000):
+        """
+        :param path: SQLite 文件路径，None 表示只使用内存层
+        :param memory_bytes: 内存 LRU 中向量数据的字节上限
+        :param max_entries: 磁盘层的条目上限，超出后淘汰最久未访问的条目
+        """
+        self.memory_bytes = memory_bytes
+        self.max_entries = max_entries
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._memory_used = 0  # 内存层向量的字节数
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+            self._conn.commit()
+        # 磁盘条目数的估计值（INSERT OR REPLACE 可能高估），超过上限时才真正计数
+        self._disk_count = self._count()
+
+    @staticmethod
+    def make_key(model: str, task_type: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{task_type}:{digest}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """批量查询，返回命中的 {key: float32 向量}（只读，调用方不要原地修改）"""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            missing = []
+            for key in dict.fromkeys(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+
+            if missing and self._conn is not None:
+                now = time.time()
+                for i in range(0, len(missing), 500):  # SQLite 参数个数有上限
+                    part = missing[i:i + 500]
+                    placeholders = ",".join("?" * len(part))
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+                    if rows:
+                        self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                               [(now, key) for key, _ in rows])
+                self._conn.commit()
+                self.disk_hits += sum(1 for key in missing if key in found)
+
+            self.misses += sum(1 for key in missing if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """批量写入两级缓存"""
+        if not items:
+            return
+        vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            if self._conn is not None:
+                now = time.time()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                    [(key, vector.tobytes(), now) for key, vector in vectors.items()]
+                )
+                self._disk_count += len(items)
+                if self._disk_count > self.max_entries:
+                    self._evict()
+                self._conn.commit()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        if vector.nbytes > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_used -= previous.nbytes
+        self._memory[key] = vector
+        self._memory_used += vector.nbytes
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= evicted.nbytes
+
+    def _count(self) -> int:
+        if self._conn is None:
+            return 0
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _evict(self):
+        count = self._count()
+        if count > self.max_entries:
+            # 一次多淘汰一些，避免每次写入都触发淘汰
+            excess = count - self.max_entries + self.max_entries // 10
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)", (excess,)
+            )
+            count -= excess
+        self._disk_count = count
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_used,
+            "disk_entries": self._disk_count,
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
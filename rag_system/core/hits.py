@@ -0,0 +1,42 @@
+"""
+检索命中记录
+各检索分支返回 Hit 而不是文本：以 chunk id 标识，携带来源、分数和名次，
+融合在 id 上进行，文本只在候选进入重排时才按需取回。
+"""
+from typing import Dict, List
+
+
+class Hit:
+    """
+    一条检索命中。
+    - score：单个分支中为该分支的原始分数（BM25 分数；向量检索为负的 L2 距离，越大越相关），融合后为加权 RRF 分数
+    - ranks / scores：{分支名: 名次 / 原始分数}
+    - text：文本，取回之前为 None
+    """
+    __slots__ = ("id", "source", "score", "ranks", "scores", "text")
+
+    def __init__(self, id: str, source: str | None = None, score: float = 0.0,
+                 ranks: Dict[str, int] | None = None, scores: Dict[str, float] | None = None,
+                 text: str | None = None):
+        self.id = id
+        self.source = source
+        self.score = score
+        self.ranks = ranks if ranks is not None else {}
+        self.scores = scores if scores is not None else {}
+        self.text = text
+
+    def __repr__(self):
+        return f"Hit(id={self.id!r}, source={self.source!r}, score={self.score:.4f}, ranks={self.ranks})"
+
+    @classmethod
+    def ranked(cls, leg: str, ids: List[str], scores: List[float], sources: List[str | None],
+               texts: List[str] | None = None) -> List["Hit"]:
+        """把某个分支按相关度排好序的结果包装成 Hit 列表"""
+        return [cls(doc_id, source, float(score), {leg: rank}, {leg: float(score)},
+                    texts[rank] if texts is not None else None)
+                for rank, (doc_id, score, source) in enumerate(zip(ids, scores, sources))]
+
+
+def texts_of(hits: List[Hit]) -> List[str]:
+    """取出已取回文本的命中的文本"""
+    return [hit.text for hit in hits if hit.text is not None]
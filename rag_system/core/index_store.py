@@ -0,0 +1,67 @@
+"""
+派生索引的磁盘目录布局
+索引目录下每次写入一个新的版本子目录，写完后用 os.replace 原子替换指针文件 CURRENT，
+读取方要么看到旧版本、要么看到新版本；进程在写入中途崩溃时旧版本仍然完整可用。
+最近的旧版本目录会保留一段时间，正在 mmap 它的进程不受影响。
+"""
+import hashlib
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Iterable
+
+POINTER = "CURRENT"
+
+
+def corpus_version_of(ids: Iterable[str]) -> str:
+    """由文档 id 集合计算语料版本号（与顺序无关），派生索引以此判断是否与 Chroma 一致"""
+    ids = sorted(ids)
+    digest = hashlib.sha1("\n".join(ids).encode("utf-8")).hexdigest()
+    return f"{len(ids)}-{digest}"
+
+
+def current_dir(path) -> Path | None:
+    """指针文件指向的版本目录；兼容没有指针文件的旧布局（文件直接位于 path 下）"""
+    path = Path(path)
+    try:
+        current = path / (path / POINTER).read_text(encoding="utf-8").strip()
+    except OSError:
+        return path if (path / "meta.json").exists() else None
+    return current if (current / "meta.json").exists() else None
+
+
+def write_version(path, write: Callable[[Path], None], legacy_files: Iterable[str] = (), keep: int = 2):
+    """
+    写入一个新版本并原子地切换过去。
+    :param write: 把索引文件写进给定目录的函数（必须包含 meta.json）
+    :param legacy_files: 旧布局下直接位于 path 的文件名，切换后删除
+    :param keep: 保留的版本目录数（含当前版本）
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    version_name = f"v-{time.time_ns()}-{os.getpid()}"
+    tmp_path = path / f"{version_name}.tmp"
+    tmp_path.mkdir()
+    try:
+        write(tmp_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    tmp_path.rename(path / version_name)
+
+    pointer_tmp = path / f"{POINTER}.tmp-{os.getpid()}"
+    pointer_tmp.write_text(version_name, encoding="utf-8")
+    os.replace(pointer_tmp, path / POINTER)
+    _prune(path, version_name, legacy_files, keep)
+
+
+def _prune(path: Path, current: str, legacy_files: Iterable[str], keep: int):
+    """删除较旧的版本目录和旧布局的顶层文件"""
+    versions = sorted((p for p in path.iterdir() if p.is_dir() and p.name.startswith("v-")
+                       and not p.name.endswith(".tmp")),
+                      key=lambda p: p.stat().st_mtime_ns, reverse=True)
+    for version_dir in [p for p in versions if p.name != current][keep - 1:]:
+        shutil.rmtree(version_dir, ignore_errors=True)
+    for name in legacy_files:
+        (path / name).unlink(missing_ok=True)
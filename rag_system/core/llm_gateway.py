@@ -0,0 +1,222 @@
+"""
+LLM 网关与响应缓存
+所有调用 chat.completions.create 的组件都经过同一个网关：以 (模型, messages, tools, 采样参数) 的哈希为键，
+把确定性调用（temperature=0）的响应存进 SQLite，重复入库或重放评测集时直接返回缓存结果；
+有采样随机性的调用不查也不写缓存。按组件开启缓存，支持 TTL、条目上限和命中率统计。
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable
+
+from ..utils.lazy import resolve
+
+# 不影响响应内容的传输层参数，不参与缓存键
+_TRANSPORT_KWARGS = ("timeout", "extra_headers", "extra_query", "extra_body")
+
+
+class LLMResponseCache:
+    """SQLite 中的 LLM 响应缓存：key -> 序列化后的 ChatCompletion JSON"""
+
+    def __init__(self, path, ttl: float | None = None, max_entries: int = 100_000):
+        """
+        :param path: SQLite 文件路径
+        :param ttl: 条目有效期（秒），None 表示永不过期
+        :param max_entries: 条目上限，超出后淘汰最久未访问的条目
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        payload = {k: v for k, v in request.items() if k not in _TRANSPORT_KWARGS}
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._count -= 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, response_json: str):
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_access) VALUES (?, ?, ?, ?)",
+                (key, response_json, now, now)
+            )
+            self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            # 一次多淘汰一些，避免每次写入都触发淘汰
+            excess = count - self.max_entries + self.max_entries // 10
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", (excess,)
+            )
+            count -= excess
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._count = 0
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class LLMGateway:
+    """所有组件共用的 LLM 调用入口，按组件决定是否走响应缓存"""
+
+    def __init__(self, client=None, async_client=None, cache: LLMResponseCache | None = None,
+                 cached_components: Iterable[str] | None = None):
+        """
+        :param client / async_client: OpenAI 兼容的同步 / 异步客户端（可以是 Lazy 对象）
+        :param cache: 响应缓存，None 表示不缓存
+        :param cached_components: 开启缓存的组件名，None 表示全部组件
+        """
+        self._client = client
+        self._async_client = async_client
+        self.cache = cache
+        self.cached_components = set(cached_components) if cached_components is not None else None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def client(self):
+        return resolve(self._client)
+
+    @property
+    def async_client(self):
+        return resolve(self._async_client)
+
+    def client_for(self, component: str, async_client: bool = False) -> "_ComponentClient":
+        """给组件使用的客户端视图：接口与 OpenAI 客户端一致（client.chat.completions.create）"""
+        return _ComponentClient(self, component, async_client)
+
+    # ================= 调用 =================
+
+    def _cache_key(self, component: str, kwargs: dict) -> str | None:
+        """可以缓存时返回缓存键：组件已开启缓存，且调用是确定性的（temperature=0、单个候选、非流式）"""
+        if self.cache is None:
+            return None
+        if self.cached_components is not None and component not in self.cached_components:
+            return None
+        if kwargs.get("temperature") != 0 or kwargs.get("stream") or kwargs.get("n", 1) != 1:
+            self._count(component, "bypassed")
+            return None
+        return self.cache.make_key(kwargs)
+
+    def create(self, component: str, **kwargs):
+        key = self._cache_key(component, kwargs)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count(component, "hits")
+                return self._load(cached)
+            self._count(component, "misses")
+        response = self.client.chat.completions.create(**kwargs)
+        if key is not None:
+            self._store(key, response)
+        return response
+
+    async def acreate(self, component: str, **kwargs):
+        key = self._cache_key(component, kwargs)
+        if key is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                self._count(component, "hits")
+                return self._load(cached)
+            self._count(component, "misses")
+        if self.async_client is None:
+            response = await asyncio.to_thread(self.client.chat.completions.create, **kwargs)
+        else:
+            response = await self.async_client.chat.completions.create(**kwargs)
+        if key is not None:
+            await asyncio.to_thread(self._store, key, response)
+        return response
+
+    @staticmethod
+    def _load(cached: str):
+        from openai.types.chat import ChatCompletion
+        return ChatCompletion.model_validate_json(cached)
+
+    def _store(self, key: str, response):
+        dump = getattr(response, "model_dump_json", None)
+        if dump is not None:
+            self.cache.put(key, dump())
+
+    # ================= 统计 =================
+
+    def _count(self, component: str, field: str):
+        with self._lock:
+            counters = self._stats.setdefault(component, {"hits": 0, "misses": 0, "bypassed": 0})
+            counters[field] += 1
+
+    def stats(self) -> dict:
+        """各组件的命中 / 未命中 / 绕过次数与命中率"""
+        with self._lock:
+            components = {name: dict(counters) for name, counters in self._stats.items()}
+        for counters in components.values():
+            lookups = counters["hits"] + counters["misses"]
+            counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        hits = sum(c["hits"] for c in components.values())
+        lookups = hits + sum(c["misses"] for c in components.values())
+        return {
+            "components": components,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self.cache) if self.cache is not None else 0,
+        }
+
+
+class _ComponentClient:
+    """网关的组件视图，模拟 client.chat.completions.create 的调用方式"""
+
+    def __init__(self, gateway: LLMGateway, component: str, async_client: bool):
+        self.gateway = gateway
+        self.component = component
+        self.async_client = async_client
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        if self.async_client:
+            return self.gateway.acreate(self.component, **kwargs)
+        return self.gateway.create(self.component, **kwargs)
@@ -0,0 +1,99 @@
+"""
+本地 CPU 嵌入后端
+在本机用 sentence-transformers 模型生成向量，接口与 Embedder 一致。
+按长度排序后动态组批（按字符预算而非固定条数），减少 padding 浪费；
+可配置线程数，可选 int8 动态量化。
+"""
+import asyncio
+import threading
+
+import numpy as np
+
+from .embedder import Embedder
+from .embedding_cache import EmbeddingCache
+
+# Gemini 的 task_type 对应 sentence-transformers 模型里常见的 prompt 名称
+_PROMPT_NAMES = {
+    "RETRIEVAL_QUERY": ("query",),
+    "RETRIEVAL_DOCUMENT": ("document", "passage"),
+}
+
+
+class LocalEmbedder(Embedder):
+    """基于 sentence-transformers 的本地嵌入器，可直接替换 Embedder"""
+
+    def __init__(self, model: str, cache: EmbeddingCache | None = None, threads: int | None = None,
+                 quantize: bool = False, batch_chars: int = 16_384, max_batch_size: int = 64,
+                 output_dim: int | None = None):
+        """
+        :param model: 模型名或本地 checkpoint 路径
+        :param threads: torch 线程数，None 表示使用 torch 默认值
+        :param quantize: 是否对 Linear 层做 int8 动态量化
+        :param batch_chars: 单个批次的字符预算（批次条数 × 最长文本长度）
+        :param max_batch_size: 单个批次的最大条数
+        :param output_dim: Matryoshka 截断维度
+        """
+        super().__init__(client=None, model=model, cache=cache, output_dim=output_dim)
+        # 缓存键里区分后端和量化：int8 模型与全精度模型的向量不能互相命中
+        self._cache_model = f"local:{self._cache_model}" + ("#int8" if quantize else "")
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.st_model = SentenceTransformer(model, device="cpu")
+        if quantize:
+            self.st_model = torch.quantization.quantize_dynamic(self.st_model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.batch_chars = batch_chars
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()  # 模型内部已多线程计算，外部并发调用串行化即可
+
+    def _request(self, texts, task_type):
+        # 本地推理没有配额和网络错误，不需要限流和重试
+        return self._embed_uncached(texts, task_type)
+
+    async def _arequest(self, texts, task_type):
+        # 推理是 CPU 计算，放到线程里执行，避免阻塞事件循环
+        return await asyncio.to_thread(self._embed_uncached, texts, task_type)
+
+    def _prompt_name(self, task_type):
+        prompts = getattr(self.st_model, "prompts", None) or {}
+        for name in _PROMPT_NAMES.get(task_type, ()):
+            if name in prompts:
+                return name
+        return None
+
+    def _length_sorted_batches(self, texts):
+        """按长度降序排列，在字符预算内尽量多放文本"""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        batches, current, longest = [], [], 0
+        for i in order:
+            longest_if_added = max(longest, len(texts[i]))
+            if current and (len(current) >= self.max_batch_size
+                            or longest_if_added * (len(current) + 1) > self.batch_chars):
+                batches.append(current)
+                current, longest_if_added = [], len(texts[i])
+            current.append(i)
+            longest = longest_if_added
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_uncached(self, texts, task_type):
+        if not texts:
+            return []
+        prompt_name = self._prompt_name(task_type)
+        vectors = [None] * len(texts)
+        with self._lock:
+            for batch in self._length_sorted_batches(texts):
+                encoded = self.st_model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=len(batch),
+                    prompt_name=prompt_name,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False,
+                )
+                for i, vector in zip(batch, np.asarray(encoded, dtype=np.float32)):
+                    vectors[i] = vector.tolist()
+        return vectors
@@ -0,0 +1,241 @@
+"""
+量化向量索引
+保存嵌入向量的 int8 或二值化副本用于第一阶段检索，再从 Chroma 取回候选的
+全精度向量做精确重排。Chroma 仍是向量的权威存储，本索引可随时从中重建。
+"""
+import json
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from .index_store import current_dir, write_version
+
+# 每个字节值中 1 的个数，用于二值码的汉明距离（不展开成逐位数组）
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# 引入版本子目录之前的磁盘布局：文件直接位于索引目录下
+_LEGACY_FILES = ("codes.npy", "scales.npy", "meta.json")
+
+
+class QuantizedVectorIndex:
+    """int8 / binary 量化的向量副本，支持按来源过滤的粗排"""
+
+    FORMAT_VERSION = 1
+    SCHEMES = ("int8", "binary")
+
+    def __init__(self, scheme: str = "int8"):
+        if scheme not in self.SCHEMES:
+            raise ValueError(f"不支持的量化方式: {scheme}，可选 {self.SCHEMES}")
+        self.scheme = scheme
+        self.ids: List[str] = []
+        self.sources: List[str] = []
+        self.codes: np.ndarray | None = None  # int8: (n, dim)；binary: (n, ceil(dim/8)) 按位打包
+        self.scales = np.zeros(0, dtype=np.float32)  # int8 每行的反量化系数
+        self.id_to_row: Dict[str, int] = {}
+        self._source_rows: Dict[str, np.ndarray] | None = None  # 来源分区，惰性构建
+        self._saved_version = None  # 与磁盘一致时为磁盘上的语料版本，任何增删后置空
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ================= 量化 =================
+
+    def _encode(self, vectors: np.ndarray):
+        if self.scheme == "binary":
+            return np.packbits(vectors > 0, axis=1), np.ones(len(vectors), dtype=np.float32)
+        max_abs = np.abs(vectors).max(axis=1)
+        max_abs[max_abs == 0] = 1.0
+        codes = np.round(vectors / max_abs[:, None] * 127).astype(np.int8)
+        return codes, (max_abs / 127).astype(np.float32)
+
+    def _first_pass_scores(self, query: np.ndarray, rows: np.ndarray | None) -> np.ndarray:
+        codes = self.codes if rows is None else self.codes[rows]
+        scales = self.scales if rows is None else self.scales[rows]
+        if self.scheme == "binary":
+            diff = np.bitwise_xor(codes, np.packbits(query > 0))
+            if hasattr(np, "bitwise_count"):  # NumPy >= 2
+                hamming = np.bitwise_count(diff).sum(axis=1, dtype=np.uint32)
+            else:
+                hamming = _POPCOUNT[diff].sum(axis=1, dtype=np.uint32)
+            return -hamming.astype(np.float32)
+        return (codes.astype(np.float32) @ query) * scales
+
+    # ================= 增量维护 =================
+
+    def add(self, ids: List[str], embeddings, sources: List[str]):
+        if not ids:
+            return
+        self.remove_ids([i for i in ids if i in self.id_to_row])
+        codes, scales = self._encode(np.asarray(embeddings, dtype=np.float32))
+        self.codes = codes if self.codes is None else np.concatenate([self.codes, codes])
+        self.scales = np.concatenate([self.scales, scales])
+        for doc_id, source in zip(ids, sources):
+            self.id_to_row[doc_id] = len(self.ids)
+            self.ids.append(doc_id)
+            self.sources.append(source)
+        self._source_rows = None
+        self._saved_version = None
+
+    def remove_ids(self, ids):
+        rows = {self.id_to_row[i] for i in ids if i in self.id_to_row}
+        if rows:
+            self._keep(np.array([r for r in range(len(self.ids)) if r not in rows], dtype=np.int64))
+
+    def remove_source(self, source: str):
+        rows = self.partition(source)
+        if len(rows):
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[rows] = False
+            self._keep(np.flatnonzero(keep))
+
+    def _keep(self, rows: np.ndarray):
+        self.codes = self.codes[rows]
+        self.scales = self.scales[rows]
+        self.ids = [self.ids[r] for r in rows]
+        self.sources = [self.sources[r] for r in rows]
+        self.id_to_row = {doc_id: r for r, doc_id in enumerate(self.ids)}
+        self._source_rows = None
+        self._saved_version = None
+
+    def partition(self, source: str) -> np.ndarray:
+        """某个来源的全部行号"""
+        if self._source_rows is None:
+            groups: Dict[str, list] = {}
+            for row, s in enumerate(self.sources):
+                groups.setdefault(s, []).append(row)
+            self._source_rows = {s: np.array(rows, dtype=np.int64) for s, rows in groups.items()}
+        return self._source_rows.get(source, np.zeros(0, dtype=np.int64))
+
+    # ================= 检索 =================
+
+    def candidates(self, query_embedding, n: int, source_filter=None) -> List[str]:
+        """量化粗排，返回 n 个候选 id"""
+        if not len(self) or n <= 0:
+            return []
+        rows = None
+        if source_filter is not None:
+            sources = [source_filter] if isinstance(source_filter, str) else list(dict.fromkeys(source_filter))
+            rows = np.concatenate([self.partition(s) for s in sources]) if sources else np.zeros(0, dtype=np.int64)
+            if not len(rows):
+                return []
+        scores = self._first_pass_scores(np.asarray(query_embedding, dtype=np.float32), rows)
+        n = min(n, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        if rows is not None:
+            top = rows[top]
+        return [self.ids[r] for r in top]
+
+    @staticmethod
+    def rescore(query_embedding, candidate_ids: List[str], candidate_embeddings, k: int,
+                with_distances: bool = False):
+        """
+        用全精度向量按 L2 距离（与 Chroma 默认度量一致）精确重排。
+        :param with_distances: 为 True 时返回 (id 列表, 平方 L2 距离列表)
+        """
+        if not candidate_ids:
+            return ([], []) if with_distances else []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        vectors = np.asarray(candidate_embeddings, dtype=np.float32)
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        order = np.argsort(distances, kind="stable")[:k]
+        ids = [candidate_ids[i] for i in order]
+        return (ids, distances[order].tolist()) if with_distances else ids
+
+    def sources_of(self, ids: List[str]) -> List[str | None]:
+        rows = [self.id_to_row.get(i) for i in ids]
+        return [self.sources[r] if r is not None else None for r in rows]
+
+    # ================= 持久化 =================
+
+    def save(self, path, corpus_version: str):
+        """
+        写入磁盘：写成一个新的版本子目录，再原子切换指针文件（见 index_store）。
+        索引自上次读写后没有改动且磁盘上已是同一语料版本时直接跳过。
+        """
+        if self._saved_version == corpus_version and current_dir(path) is not None:
+            return
+        write_version(path, lambda version_dir: self._write_files(version_dir, corpus_version), _LEGACY_FILES)
+        self._saved_version = corpus_version
+
+    def _write_files(self, path: Path, corpus_version: str):
+        np.save(path / "codes.npy", self.codes if self.codes is not None else np.zeros((0, 0), dtype=np.int8))
+        np.save(path / "scales.npy", self.scales)
+        meta = {
+            "format_version": self.FORMAT_VERSION,
+            "corpus_version": corpus_version,
+            "scheme": self.scheme,
+            "ids": self.ids,
+            "sources": self.sources,
+        }
+        (path / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path, scheme: str, corpus_version: str) -> "QuantizedVectorIndex | None":
+        """读取磁盘索引；版本或量化方式不匹配时返回 None"""
+        path = current_dir(path)
+        if path is None:
+            return None
+        try:
+            meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        if (meta.get("format_version") != cls.FORMAT_VERSION or meta.get("scheme") != scheme
+                or meta.get("corpus_version") != corpus_version):
+            return None
+        index = cls(scheme)
+        codes = np.load(path / "codes.npy")
+        index.codes = codes if len(codes) else None
+        index.scales = np.load(path / "scales.npy")
+        index.ids = meta["ids"]
+        index.sources = meta["sources"]
+        index.id_to_row = {doc_id: r for r, doc_id in enumerate(index.ids)}
+        index._saved_version = corpus_version
+        return index
+
+
+def truncate_embeddings(embeddings, dim: int | None):
+    """Matryoshka 截断：保留前 dim 维并重新做 L2 归一化"""
+    if not dim:
+        return embeddings
+    vectors = np.asarray(embeddings, dtype=np.float32)[:, :dim]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).tolist()
+
+
+def measure_recall(db, embedder, queries: List[str], k: int = 10, source_filter=None) -> dict:
+    """
+    评估量化检索相对全精度检索的召回损失。
+    全精度结果来自 Chroma 精确查询；分别统计仅粗排和粗排+重排两种情况的 recall@k。
+    """
+    if db.quantized_index is None:
+        raise ValueError("未启用量化索引（RAGConfig.vector_quantization）")
+    embeddings = embedder.embed(queries, task_type="RETRIEVAL_QUERY")
+    first_pass, rescored = [], []
+    for embedding in embeddings:
+        exact = db.collection.query(
+            query_embeddings=[embedding], n_results=k,
+            where={"source": source_filter} if source_filter else None,
+            include=[],
+        )["ids"][0]
+        if not exact:
+            continue
+        exact = set(exact)
+        coarse = db.quantized_index.candidates(embedding, k, source_filter)
+        final = db.quantized_search(embedding, k, source_filter)
+        first_pass.append(len(exact & set(coarse)) / len(exact))
+        rescored.append(len(exact & set(final)) / len(exact))
+
+    report = {
+        "queries": len(rescored),
+        "k": k,
+        "scheme": db.quantized_index.scheme,
+        "recall_first_pass": float(np.mean(first_pass)) if first_pass else 0.0,
+        "recall_rescored": float(np.mean(rescored)) if rescored else 0.0,
+    }
+    print(f"[量化召回评估] {report['scheme']} recall@{k}: "
+          f"粗排 {report['recall_first_pass']:.4f}，重排后 {report['recall_rescored']:.4f} "
+          f"（{report['queries']} 个查询）")
+    return report
@@ -0,0 +1,178 @@
+"""
+NumPy 精确向量索引
+把全部嵌入保存为连续的 float32 矩阵（连同每行的平方范数落盘，以 mmap 只读打开，多进程共享页缓存），
+用一次矩阵乘法完成批量多查询的精确 L2 检索，argpartition 做 top-k。
+Chroma 仍是权威存储，本索引随写入增量更新，版本不一致时从 Chroma 重建。
+"""
+import json
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from .index_store import current_dir, write_version
+
+# 引入版本子目录之前的磁盘布局：文件直接位于索引目录下
+_LEGACY_FILES = ("vectors.npy", "meta.json")
+
+
+class VectorIndex:
+    """内存/mmap 中的精确向量索引：id -> 行号，并按来源分区"""
+
+    FORMAT_VERSION = 1
+
+    def __init__(self):
+        self.vectors: np.ndarray | None = None  # (n, dim) float32
+        self.sq_norms = np.zeros(0, dtype=np.float32)  # 每行的 ||x||^2
+        self.ids: List[str] = []
+        self.sources: List[str] = []
+        self.id_to_row: Dict[str, int] = {}
+        self._source_rows: Dict[str, np.ndarray] | None = None  # 来源分区，惰性构建
+        self._saved_version = None  # 与磁盘一致时为磁盘上的语料版本，任何增删后置空
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ================= 增量维护 =================
+
+    def add(self, ids: List[str], embeddings, sources: List[str]):
+        if not ids:
+            return
+        self.remove_ids([i for i in ids if i in self.id_to_row])
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        self.vectors = vectors if self.vectors is None else np.concatenate([self.vectors, vectors])
+        self.sq_norms = np.concatenate([self.sq_norms, (vectors ** 2).sum(axis=1)])
+        for doc_id, source in zip(ids, sources):
+            self.id_to_row[doc_id] = len(self.ids)
+            self.ids.append(doc_id)
+            self.sources.append(source)
+        self._source_rows = None
+        self._saved_version = None
+
+    def remove_ids(self, ids):
+        rows = {self.id_to_row[i] for i in ids if i in self.id_to_row}
+        if rows:
+            self._keep(np.array([r for r in range(len(self.ids)) if r not in rows], dtype=np.int64))
+
+    def remove_source(self, source: str):
+        rows = self.partition(source)
+        if len(rows):
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[rows] = False
+            self._keep(np.flatnonzero(keep))
+
+    def _keep(self, rows: np.ndarray):
+        self.vectors = self.vectors[rows]
+        self.sq_norms = self.sq_norms[rows]
+        self.ids = [self.ids[r] for r in rows]
+        self.sources = [self.sources[r] for r in rows]
+        self.id_to_row = {doc_id: r for r, doc_id in enumerate(self.ids)}
+        self._source_rows = None
+        self._saved_version = None
+
+    def partition(self, source: str) -> np.ndarray:
+        """某个来源的全部行号"""
+        if self._source_rows is None:
+            groups: Dict[str, list] = {}
+            for row, s in enumerate(self.sources):
+                groups.setdefault(s, []).append(row)
+            self._source_rows = {s: np.array(rows, dtype=np.int64) for s, rows in groups.items()}
+        return self._source_rows.get(source, np.zeros(0, dtype=np.int64))
+
+    def get_vectors(self, ids: List[str]):
+        """按 id 取回向量（不存在的 id 被跳过），返回 (ids, 向量矩阵)"""
+        found = [i for i in ids if i in self.id_to_row]
+        rows = np.array([self.id_to_row[i] for i in found], dtype=np.int64)
+        return found, self.vectors[rows] if len(rows) else np.zeros((0, 0), dtype=np.float32)
+
+    # ================= 检索 =================
+
+    def search(self, query_embeddings, k: int = 5, source_filter=None, with_distances: bool = False):
+        """
+        批量精确检索，按 L2 距离（与 Chroma 默认度量一致）返回每个查询的 top-k id。
+        :param query_embeddings: (q, dim) 的查询向量
+        :param with_distances: 为 True 时返回 (id 列表, 平方 L2 距离列表)
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        empty = [[] for _ in queries]
+        if not len(self) or k <= 0:
+            return (empty, [[] for _ in queries]) if with_distances else empty
+
+        rows = None
+        if source_filter is not None:
+            sources = [source_filter] if isinstance(source_filter, str) else list(source_filter)
+            rows = np.concatenate([self.partition(s) for s in sources]) if sources else np.zeros(0, dtype=np.int64)
+            if not len(rows):
+                return (empty, [[] for _ in queries]) if with_distances else empty
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        sq_norms = self.sq_norms if rows is None else self.sq_norms[rows]
+
+        # ||x - q||^2 = ||x||^2 - 2 x·q + ||q||^2，最后一项对排序无影响
+        distances = sq_norms[None, :] - 2.0 * (queries @ vectors.T)
+        k = min(k, distances.shape[1])
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+        ids = [[self.ids[r] for r in row] for row in top]
+        if not with_distances:
+            return ids
+        top_distances = np.take_along_axis(top_distances, order, axis=1) + (queries ** 2).sum(axis=1)[:, None]
+        return ids, top_distances.tolist()
+
+    def sources_of(self, ids: List[str]) -> List[str | None]:
+        rows = [self.id_to_row.get(i) for i in ids]
+        return [self.sources[r] if r is not None else None for r in rows]
+
+    # ================= 持久化 =================
+
+    def save(self, path, corpus_version: str):
+        """
+        写入磁盘：写成一个新的版本子目录，再原子切换指针文件（见 index_store）。
+        每次都会重写整个向量矩阵，索引自上次读写后没有改动且磁盘上已是同一语料版本时直接跳过。
+        """
+        if self._saved_version == corpus_version and current_dir(path) is not None:
+            return
+        write_version(path, lambda version_dir: self._write_files(version_dir, corpus_version), _LEGACY_FILES)
+        self._saved_version = corpus_version
+
+    def _write_files(self, path: Path, corpus_version: str):
+        vectors = self.vectors if self.vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        np.save(path / "vectors.npy", np.ascontiguousarray(vectors, dtype=np.float32))
+        np.save(path / "sq_norms.npy", np.asarray(self.sq_norms, dtype=np.float32))
+        meta = {
+            "format_version": self.FORMAT_VERSION,
+            "corpus_version": corpus_version,
+            "ids": self.ids,
+            "sources": self.sources,
+        }
+        (path / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path, corpus_version: str, mmap: bool = True) -> "VectorIndex | None":
+        """以 mmap 只读方式打开磁盘索引；版本不匹配时返回 None"""
+        path = current_dir(path)
+        if path is None:
+            return None
+        try:
+            meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        if meta.get("format_version") != cls.FORMAT_VERSION or meta.get("corpus_version") != corpus_version:
+            return None
+        index = cls()
+        mmap_mode = "r" if mmap else None
+        vectors = np.load(path / "vectors.npy", mmap_mode=mmap_mode)
+        if len(vectors):
+            index.vectors = vectors
+            if (path / "sq_norms.npy").exists():
+                index.sq_norms = np.load(path / "sq_norms.npy", mmap_mode=mmap_mode)
+            else:  # 旧版本没有保存范数，只能读一遍整个矩阵
+                index.sq_norms = (np.asarray(vectors) ** 2).sum(axis=1, dtype=np.float32)
+        index.ids = meta["ids"]
+        index.sources = meta["sources"]
+        index.id_to_row = {doc_id: r for r, doc_id in enumerate(index.ids)}
+        index._saved_version = corpus_version
+        return index
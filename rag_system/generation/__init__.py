@@ -3,11 +3,16 @@
 提供答案生成和上下文压缩功能
 """
 
-from .generator import Generator
-from .compressor import Compressor
+from ..utils.lazy import lazy_exports
+
+_EXPORTS = {
+    'Generator': '.generator',
+    'Compressor': '.compressor',
+}
 
 __all__ = [
     'Generator',
     'Compressor',
 ]
 
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -1,17 +1,36 @@
+import asyncio
+
 class Compressor:
-    def __init__(self, llm_client, llm_model, verbose=True):
+    def __init__(self, llm_client, llm_model, verbose=True, async_client=None):
         self.client = llm_client
+        self.async_client = async_client
         self.model = llm_model
         self.verbose = verbose
 
-    def compress(self, query, docs):
+    def _messages(self, query, docs):
         context = "\n\n".join(docs)
         prompt = f"根据问题《{query}》，请从以下上下文中抽取最相关的句子，保持原句，不要改写：\n{context}, 每个文档之间的结果用空行分割"
+        return [
+            {"role": "system", "content": "你是一个擅长文档信息处理的专家。"},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def _parse(response):
+        return [s.strip() for s in response.choices[0].message.content.split('\n') if s.strip()]
+
+    def compress(self, query, docs):
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "system", "content": "你是一个擅长文档信息处理的专家。"},
-                {"role": "user", "content": prompt}
-            ]
+            messages=self._messages(query, docs)
         )
-        return [s.strip() for s in response.choices[0].message.content.split('\n') if s.strip()]
+        return self._parse(response)
+
+    async def acompress(self, query, docs):
+        if self.async_client is None:
+            return await asyncio.to_thread(self.compress, query, docs)
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(query, docs)
+        )
+        return self._parse(response)
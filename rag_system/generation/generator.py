@@ -1,11 +1,16 @@
+import asyncio
 import json
 
 class Generator:
-    def __init__(self, llm_client, llm_model):
+    def __init__(self, llm_client, llm_model, async_client=None):
+        """
+        :param async_client: 可选的 AsyncOpenAI 客户端，供 agenerate 使用
+        """
         self.client = llm_client
+        self.async_client = async_client
         self.model = llm_model
 
-    def generate(self, query, text_docs, graph_context) -> str:
+    def _messages(self, query, text_docs, graph_context):
         text_context = "\n\n".join(text_docs)
         prompt = f"""
         把下面提供的文本数据和图谱数据信息结合起来，得到更加全面准确的答案。
@@ -22,10 +27,21 @@ class Generator:
         图谱数据：{json.dumps(graph_context, ensure_ascii=False, indent=2)}
         ---
         """
+        return [
+            {"role": "system", "content": "你是一个问答助手，擅长结合文本数据库和图谱数据库中的信息回答问题。"},
+            {"role": "user", "content": prompt}
+        ]
+
+    def generate(self, query, text_docs, graph_context) -> str:
         resp = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "system", "content": "你是一个问答助手，擅长结合文本数据库和图谱数据库中的信息回答问题。"},
-                {"role": "user", "content": prompt}
-            ])
-        return resp.choices[0].message.content.strip()
\ No newline at end of file
+            messages=self._messages(query, text_docs, graph_context))
+        return resp.choices[0].message.content.strip()
+
+    async def agenerate(self, query, text_docs, graph_context) -> str:
+        if self.async_client is None:
+            return await asyncio.to_thread(self.generate, query, text_docs, graph_context)
+        resp = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(query, text_docs, graph_context))
+        return resp.choices[0].message.content.strip()
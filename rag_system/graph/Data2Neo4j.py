@@ -1,8 +1,6 @@
 import json
 from typing import List, Tuple, Dict, Set
 
-from neo4j import GraphDatabase
-
 from .data_structure import KnowledgeGraph, MergeMapping
 from .knowledge_graph_builder import KnowledgeGraphBuilder
 
@@ -12,7 +10,8 @@ class Data2Neo4j:
     兼容适配器类 - 保持向后兼容性
     内部使用重构后的KnowledgeGraphBuilder来实现功能
     """
-    def __init__(self, client, model, driver):
+    def __init__(self, client, model, driver, async_client=None, extraction_workers: int = 1,
+                 candidate_entities: int | None = 50):
         self.client = client
         self.model = model
         
@@ -21,7 +20,9 @@ class Data2Neo4j:
             'uri': driver['uri'],
             'auth': driver['auth']
         }
-        self.builder = KnowledgeGraphBuilder(client, model, neo4j_config)
+        self.builder = KnowledgeGraphBuilder(client, model, neo4j_config, async_llm_client=async_client,
+                                             extraction_workers=extraction_workers,
+                                             candidate_entities=candidate_entities)
         
         # 保持兼容性的属性
         self.document_entities = self.builder.document_entities
@@ -31,6 +32,10 @@ class Data2Neo4j:
         """关闭图谱构建器"""
         if hasattr(self, 'builder') and self.builder:
             self.builder.close()
+
+    async def aclose(self):
+        """关闭当前事件循环的异步驱动"""
+        await self.builder.aclose()
             
     # 移除__del__方法，避免重复关闭
     # 实际的资源管理由Neo4jDatabase负责
@@ -41,21 +46,30 @@ class Data2Neo4j:
         """向后兼容的单chunk处理方法"""
         self.builder.process_single_chunk(filename, text, doc_entities_mapping)
     
-    def process_document(self, filename: str, full_text: str, chunks: list):
+    def process_document(self, filename: str, full_text: str, chunks: list, workers: int | None = None,
+                         chunk_ids: list | None = None, doc_entities_mapping: dict | None = None):
         """文档级处理方法"""
-        self.builder.process_document(filename, full_text, chunks)
+        return self.builder.process_document(filename, full_text, chunks, workers, chunk_ids, doc_entities_mapping)
     
     def after_processing(self):
         """后处理合并"""
         self.builder.execute_post_processing()
     
-    def delete_graph_from_sources(self, source_doc_id: str):
+    def delete_graph_from_sources(self, source_doc_id: str, chunk_ids: list | None = None):
         """删除文档图谱数据"""
-        self.builder.delete_document(source_doc_id)
+        self.builder.delete_document(source_doc_id, chunk_ids)
+
+    def retract_chunks(self, chunk_ids: list):
+        """撤回指定 chunk 的图谱数据"""
+        self.builder.retract_chunks(chunk_ids)
     
     def query_graph_raw(self, question: str):
         """图谱查询"""
         return self.builder.query_graph(question)
+
+    async def aquery_graph_raw(self, question: str):
+        """异步图谱查询"""
+        return await self.builder.aquery_graph(question)
     
     def get_graph_schema(self) -> dict:
         """获取图谱Schema"""
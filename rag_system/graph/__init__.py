@@ -3,6 +3,7 @@
 
 重构后的SOLID架构：
 - Neo4jDatabase: 数据库连接和基础操作
+- EntityRegistry: 进程内实体注册表，替代全图扫描
 - EntityExtractor: 实体提取和三元组抽取
 - GraphProcessor: 图谱结构化和验证
 - GraphQueryEngine: 图谱查询和Cypher生成
@@ -12,6 +13,7 @@
 """
 
 from .data_structure import KnowledgeGraph, Node, Edge, MergeMapping
+from .entity_registry import EntityRegistry
 from .graph_database import Neo4jDatabase
 from .entity_extractor import EntityExtractor
 from .graph_processor import GraphProcessor
@@ -22,7 +24,7 @@ from .Data2Neo4j import Data2Neo4j
 
 __all__ = [
     'KnowledgeGraph', 'Node', 'Edge', 'MergeMapping',
-    'Neo4jDatabase', 'EntityExtractor', 'GraphProcessor',
+    'EntityRegistry', 'Neo4jDatabase', 'EntityExtractor', 'GraphProcessor',
     'GraphQueryEngine', 'EntityMerger', 'KnowledgeGraphBuilder',
     'Data2Neo4j'
 ]
@@ -0,0 +1,171 @@
+"""
+实体注册表
+在进程内保存图谱中全部实体的 id、标签和来源文档集合，只在首次使用时从 Neo4j 加载一次，
+之后随 insert_graph / merge_entities / delete_source_documents 增量更新，
+抽取、合并和查询阶段读取注册表，不再每次全图扫描。
+注册表同时维护实体 id 的字符 n-gram 倒排索引，用于为结构化提示词挑选少量相关的候选实体。
+"""
+import heapq
+import itertools
+import math
+import re
+import threading
+from typing import Dict, Iterable, List, Set
+
+from .data_structure import KnowledgeGraph
+
+
+# "(主体, 关系, 客体)"，兼容中英文括号和逗号
+_TRIPLE_PATTERN = re.compile(r"[（(]\s*(.+?)\s*[,，]\s*(.+?)\s*[,，]\s*(.+?)\s*[)）]")
+
+
+def char_ngrams(text: str, n: int = 2) -> Set[str]:
+    """去掉空白后的字符 n-gram 集合（短于 n 的文本整体作为一个 gram）"""
+    text = "".join(text.lower().split())
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def triple_mentions(triples_str: str) -> List[str]:
+    """从粗提取的三元组文本中取出主体和客体；没有可解析的三元组时按行返回"""
+    mentions = []
+    for line in triples_str.splitlines():
+        match = _TRIPLE_PATTERN.search(line)
+        if match:
+            mentions.extend([match.group(1), match.group(3)])
+        elif line.strip():
+            mentions.append(line.strip())
+    return list(dict.fromkeys(mentions))
+
+
+class EntityRegistry:
+    """线程安全的实体注册表：id -> (标签, 来源集合)，每次修改后 version 加一"""
+
+    def __init__(self):
+        self._labels: Dict[str, str] = {}
+        self._sources: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}  # n-gram -> 实体 id
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __contains__(self, entity_id):
+        return entity_id in self._labels
+
+    def load(self, records: Iterable[tuple]):
+        """用 (id, label, sources) 记录整体替换注册表内容"""
+        labels, sources, postings = {}, {}, {}
+        for entity_id, label, entity_sources in records:
+            if entity_id is None:
+                continue
+            labels[entity_id] = label
+            sources[entity_id] = set(entity_sources or [])
+            for gram in char_ngrams(entity_id):
+                postings.setdefault(gram, set()).add(entity_id)
+        with self._lock:
+            self._labels, self._sources, self._postings = labels, sources, postings
+            self.version += 1
+
+    # ================= 读取 =================
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._labels)
+
+    def label_of(self, entity_id: str) -> str | None:
+        return self._labels.get(entity_id)
+
+    def sources_of(self, entity_id: str) -> Set[str]:
+        with self._lock:
+            return set(self._sources.get(entity_id, ()))
+
+    def labels_in_use(self) -> Set[str]:
+        with self._lock:
+            return set(self._labels.values())
+
+    def similar(self, mentions: List[str], top_n: int, extra_ids: Iterable[str] = ()) -> List[str]:
+        """
+        按字符 n-gram 相似度为一组实体提及挑选最相关的 top_n 个已有实体 id。
+        相似度为共享 gram 的 idf 之和除以两边 gram 数的几何平均，实体得分取各提及中的最高分。
+        :param extra_ids: 尚未写入注册表、但也参与挑选的实体 id（如文档级实体映射）
+        """
+        mention_grams = [grams for grams in (char_ngrams(m) for m in mentions) if grams]
+        extra_ids = [i for i in dict.fromkeys(extra_ids) if i not in self._labels]
+        scores: Dict[str, float] = {}
+        with self._lock:
+            total = len(self._labels) + len(extra_ids)
+            if not total:
+                return []
+            extra_postings: Dict[str, Set[str]] = {}
+            for entity_id in extra_ids:
+                for gram in char_ngrams(entity_id):
+                    extra_postings.setdefault(gram, set()).add(entity_id)
+            gram_counts: Dict[str, int] = {}
+            for grams in mention_grams:
+                shared: Dict[str, float] = {}
+                for gram in grams:
+                    holders, extra = self._postings.get(gram, ()), extra_postings.get(gram, ())
+                    if not holders and not extra:
+                        continue
+                    idf = math.log(1 + total / (len(holders) + len(extra)))
+                    for entity_id in itertools.chain(holders, extra):
+                        shared[entity_id] = shared.get(entity_id, 0.0) + idf
+                for entity_id, weight in shared.items():
+                    if entity_id not in gram_counts:
+                        gram_counts[entity_id] = len(char_ngrams(entity_id))
+                    score = weight / math.sqrt(gram_counts[entity_id] * len(grams))
+                    if score > scores.get(entity_id, 0.0):
+                        scores[entity_id] = score
+        return heapq.nlargest(top_n, scores, key=scores.get)
+
+    # ================= 增量更新（与数据库写入保持一致） =================
+
+    def add_graph(self, graph: KnowledgeGraph, source_doc_id: str):
+        """对应 insert_graph：MERGE 节点并追加来源"""
+        if not graph.nodes:
+            return
+        with self._lock:
+            for node in graph.nodes:
+                if node.id not in self._labels:
+                    self._index(node.id)
+                self._labels.setdefault(node.id, node.label)
+                self._sources.setdefault(node.id, set()).add(source_doc_id)
+            self.version += 1
+
+    def merge(self, duplicate_id: str, primary_id: str):
+        """对应 merge_entities：重复实体并入主实体，来源取并集"""
+        with self._lock:
+            if duplicate_id not in self._labels or primary_id not in self._labels:
+                return
+            self._sources[primary_id] |= self._sources.pop(duplicate_id)
+            del self._labels[duplicate_id]
+            self._unindex(duplicate_id)
+            self.version += 1
+
+    def remove_sources(self, source_ids: Iterable[str]):
+        """对应 delete_source_documents：移除来源，来源为空的实体被删除"""
+        source_ids = set(source_ids)
+        with self._lock:
+            for entity_id in [i for i, s in self._sources.items() if not s or not s.isdisjoint(source_ids)]:
+                sources = self._sources[entity_id]
+                sources -= source_ids
+                if not sources:
+                    del self._sources[entity_id]
+                    del self._labels[entity_id]
+                    self._unindex(entity_id)
+            self.version += 1
+
+    def _index(self, entity_id: str):
+        for gram in char_ngrams(entity_id):
+            self._postings.setdefault(gram, set()).add(entity_id)
+
+    def _unindex(self, entity_id: str):
+        for gram in char_ngrams(entity_id):
+            holders = self._postings.get(gram)
+            if holders is not None:
+                holders.discard(entity_id)
+                if not holders:
+                    del self._postings[gram]
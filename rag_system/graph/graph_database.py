@@ -2,9 +2,13 @@
 Neo4j图数据库操作类
 遵循单一职责原则，专门负责数据库连接和基础CRUD操作
 """
+import asyncio
+import threading
 from typing import List, Dict
-from neo4j import GraphDatabase as Neo4jDriver
+from neo4j import AsyncGraphDatabase, GraphDatabase as Neo4jDriver
 from .data_structure import KnowledgeGraph
+from .entity_registry import EntityRegistry
+from ..utils.lazy import LoopLocal
 
 
 class Neo4jDatabase:
@@ -12,7 +16,17 @@ class Neo4jDatabase:
     
     def __init__(self, uri: str, auth: tuple):
         self.driver = Neo4jDriver.driver(uri, auth=auth)
+        # 异步驱动绑定事件循环：每个事件循环在首次异步查询时各自创建一个
+        self._async_drivers = LoopLocal(lambda: AsyncGraphDatabase.driver(uri, auth=auth))
+        self._registry: EntityRegistry | None = None  # 实体注册表在首次使用时加载
+        self._registry_lock = threading.Lock()
+        self._indexed_labels: set = set()  # 已创建 id 约束/索引的标签
         print("[Neo4jDatabase] Driver initialized.")
+
+    @property
+    def async_driver(self):
+        """当前事件循环的异步驱动（多次 asyncio.run 各自使用自己的驱动）"""
+        return self._async_drivers.get()
     
     def close(self):
         """关闭数据库连接"""
@@ -20,18 +34,48 @@ class Neo4jDatabase:
             self.driver.close()
             self.driver = None  # 避免重复关闭
             print("Neo4j Driver closed.")
+
+    async def aclose(self):
+        """关闭当前事件循环的异步驱动"""
+        driver = self._async_drivers.pop()
+        if driver is not None:
+            await driver.close()
     
     def __del__(self):
         self.close()
     
-    def get_existing_entities(self) -> List[str]:
-        """获取数据库中所有现有实体ID"""
+    @property
+    def entity_registry(self) -> EntityRegistry:
+        """实体注册表，首次访问时全图扫描一次，之后随本类的写操作增量更新"""
+        if self._registry is None:
+            with self._registry_lock:
+                if self._registry is None:
+                    registry = EntityRegistry()
+                    registry.load(self._scan_entities())
+                    self._registry = registry
+                    print(f"[Neo4jDatabase] 实体注册表已加载: {len(registry)} 个实体")
+        return self._registry
+
+    def refresh_entity_registry(self):
+        """数据库被其他进程修改后，重新全量加载实体注册表"""
+        self.entity_registry.load(self._scan_entities())
+
+    def _scan_entities(self) -> List[tuple]:
         if not self.driver:
             return []
         with self.driver.session() as session:
-            entities = session.run("MATCH (n) RETURN n.id AS id, labels(n)[0] AS label")
-            ids = [record['id'] for record in entities]
-        return ids
+            result = session.run("MATCH (n) RETURN n.id AS id, labels(n)[0] AS label, n.sources AS sources")
+            return [(record['id'], record['label'], record['sources']) for record in result]
+
+    def get_existing_entities(self) -> List[str]:
+        """获取数据库中所有现有实体ID（读取实体注册表，不扫描数据库）"""
+        return self.entity_registry.ids()
+
+    async def aget_existing_entities(self) -> List[str]:
+        """get_existing_entities 的异步版本"""
+        if self._registry is None:
+            return await asyncio.to_thread(self.get_existing_entities)
+        return self._registry.ids()
     
     def get_graph_schema(self) -> dict:
         """获取图谱Schema信息"""
@@ -46,62 +90,131 @@ class Neo4jDatabase:
             "node_labels": node_labels,
             "relationship_types": edge_labels
         }
+
+    async def aget_graph_schema(self) -> dict:
+        """get_graph_schema 的异步版本"""
+        async with self.async_driver.session() as session:
+            node_labels = (await (await session.run(
+                "CALL db.labels() YIELD label RETURN collect(label) AS labels")).single())['labels']
+            edge_labels = (await (await session.run(
+                "CALL db.relationshipTypes() YIELD relationshipType RETURN collect(relationshipType) AS types"
+            )).single())['types']
+        return {
+            "node_labels": node_labels,
+            "relationship_types": edge_labels
+        }
     
+    def ensure_id_indexes(self, labels):
+        """为尚未处理过的标签创建 id 唯一约束（已有数据违反唯一性时退化为普通索引）"""
+        labels = set(labels) - self._indexed_labels
+        if not labels or not self.driver:
+            return
+        with self.driver.session() as session:
+            for label in labels:
+                try:
+                    session.run(f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:{label}) REQUIRE n.id IS UNIQUE").consume()
+                except Exception as e:
+                    print(f"[Neo4jDatabase] 无法为 {label} 创建唯一约束，改建普通索引: {e}")
+                    session.run(f"CREATE INDEX IF NOT EXISTS FOR (n:{label}) ON (n.id)").consume()
+        self._indexed_labels |= labels
+
+    @staticmethod
+    def _node_pattern(var: str, id_expr: str, label: str | None) -> str:
+        """带标签的节点匹配模式，可以走 id 索引；标签未知时退化为全标签扫描"""
+        return f"({var}:{label} {{id: {id_expr}}})" if label else f"({var} {{id: {id_expr}}})"
+
     def insert_graph(self, graph: KnowledgeGraph, source_doc_id: str):
-        """将知识图谱插入数据库"""
+        """
+        将知识图谱插入数据库。
+        节点按标签、边按（关系类型, 起点标签, 终点标签）分组，每组一条 UNWIND 语句写入；
+        边的端点按标签查找，标签取自本次图谱中的节点或实体注册表。
+        """
+        registry = self.entity_registry
+        node_labels = {node.id: node.label for node in graph.nodes}
+
+        node_groups: Dict[str, List[dict]] = {}
+        for node in graph.nodes:
+            node_groups.setdefault(node.label, []).append({"id": node.id, "props": node.properties})
+        edge_groups: Dict[tuple, List[dict]] = {}
+        for edge in graph.edges:
+            key = (edge.label,
+                   node_labels.get(edge.source) or registry.label_of(edge.source),
+                   node_labels.get(edge.target) or registry.label_of(edge.target))
+            edge_groups.setdefault(key, []).append(
+                {"source": edge.source, "target": edge.target, "props": edge.properties})
+
+        labels = set(node_groups) | {label for key in edge_groups for label in key[1:] if label}
+        if not self._indexed_labels:  # 首次写入时为已有的全部标签建索引
+            labels |= registry.labels_in_use()
+        self.ensure_id_indexes(labels)
+
         with self.driver.session() as session:
             with session.begin_transaction() as tx:
                 # 建点
-                for node in graph.nodes:
+                for label, rows in node_groups.items():
                     cypher_query = f"""
-                    MERGE (n:{node.label} {{id: $id}})
-                    SET n += $props
+                    UNWIND $rows AS row
+                    MERGE (n:{label} {{id: row.id}})
+                    SET n += row.props
                     SET n.sources = [s IN coalesce(n.sources, []) WHERE s <> $source_doc_id] + [$source_doc_id]
                     """
-                    tx.run(cypher_query, id=node.id, props=node.properties, source_doc_id=source_doc_id)
-                    print(f"Merged node: {node.label}(id='{node.id}')")
+                    tx.run(cypher_query, rows=rows, source_doc_id=source_doc_id).consume()
                 
                 # 建边
-                for edge in graph.edges:
+                for (edge_label, source_label, target_label), rows in edge_groups.items():
                     cypher_query = f"""
-                    MATCH (a {{id: $source_id}}), (b {{id: $target_id}})
-                    MERGE (a) -[r:{edge.label}]-> (b)
-                    SET r += $props
+                    UNWIND $rows AS row
+                    MATCH {self._node_pattern("a", "row.source", source_label)}
+                    MATCH {self._node_pattern("b", "row.target", target_label)}
+                    MERGE (a) -[r:{edge_label}]-> (b)
+                    SET r += row.props
                     SET r.sources = [s IN coalesce(r.sources, []) WHERE s <> $source_doc_id] + [$source_doc_id]
                     """
-                    tx.run(cypher_query, source_id=edge.source, target_id=edge.target,
-                           props=edge.properties, source_doc_id=source_doc_id)
-                    print(f"Merged edge: ({edge.source})-[{edge.label}]->({edge.target})")
-        
-        print("\nGraph ingestion complete!")
+                    tx.run(cypher_query, rows=rows, source_doc_id=source_doc_id).consume()
+
+        registry.add_graph(graph, source_doc_id)
+        print(f"Graph ingestion complete! {len(graph.nodes)} nodes in {len(node_groups)} statements, "
+              f"{len(graph.edges)} edges in {len(edge_groups)} statements.")
     
     def execute_cypher(self, cypher_query: str) -> List[Dict]:
         """执行Cypher查询并返回结果"""
         with self.driver.session() as session:
             result = session.run(cypher_query)
             return [record.data() for record in result]
+
+    async def aexecute_cypher(self, cypher_query: str) -> List[Dict]:
+        """execute_cypher 的异步版本"""
+        async with self.async_driver.session() as session:
+            result = await session.run(cypher_query)
+            return [record.data() async for record in result]
     
-    def delete_source_documents(self, source_doc_id: str):
-        """删除指定来源文档的所有图谱数据"""
-        print(f"Deleting source: '{source_doc_id}'...")
+    def delete_source_documents(self, source_doc_id: str | List[str]):
+        """
+        删除指定来源的所有图谱数据。
+        :param source_doc_id: 一个或多个来源标签（文件名，或按 chunk 写入时的 chunk id）
+        """
+        source_ids = [source_doc_id] if isinstance(source_doc_id, str) else list(source_doc_id)
+        if not source_ids:
+            return
+        print(f"Deleting source: '{source_ids[0]}'" + (f" and {len(source_ids) - 1} more" if len(source_ids) > 1 else "") + "...")
         with self.driver.session() as session:
             with session.begin_transaction() as tx:
                 # 移除所有节点的文档来源属性
                 node_unlink_query = """
-                MATCH (n) WHERE $source_doc_id IN n.sources
-                SET n.sources = [s IN n.sources WHERE s <> $source_doc_id]
+                MATCH (n) WHERE any(s IN n.sources WHERE s IN $source_ids)
+                SET n.sources = [s IN n.sources WHERE NOT s IN $source_ids]
                 RETURN count(n) AS nodes_unlinked
                 """
-                node_result = tx.run(node_unlink_query, source_doc_id=source_doc_id).single()
+                node_result = tx.run(node_unlink_query, source_ids=source_ids).single()
                 print(f"  - Unlinked source from {node_result['nodes_unlinked']} nodes.")
 
                 # 移除所有边的文档来源属性
                 edge_unlink_query = """
-                MATCH ()-[r]->() WHERE $source_doc_id IN r.sources
-                SET r.sources = [s IN r.sources WHERE s <> $source_doc_id]
+                MATCH ()-[r]->() WHERE any(s IN r.sources WHERE s IN $source_ids)
+                SET r.sources = [s IN r.sources WHERE NOT s IN $source_ids]
                 RETURN count(r) AS edges_unlinked
                 """
-                edge_result = tx.run(edge_unlink_query, source_doc_id=source_doc_id).single()
+                edge_result = tx.run(edge_unlink_query, source_ids=source_ids).single()
                 print(f"  - Unlinked source from {edge_result['edges_unlinked']} edges.")
 
                 # 删除孤儿关系
@@ -122,7 +235,9 @@ class Neo4jDatabase:
                 node_del_result = tx.run(orphan_node_query).single()
                 print(f"  - Deleted {node_del_result['nodes_deleted']} orphan nodes.")
 
-        print(f"\nDeletion process for '{source_doc_id}' complete!")
+        if self._registry is not None:
+            self._registry.remove_sources(source_ids)
+        print(f"\nDeletion process for '{source_ids[0]}' complete!")
     
     def merge_entities(self, merge_mapping: dict):
         """根据映射关系合并重复实体"""
@@ -137,12 +252,14 @@ class Neo4jDatabase:
                     continue
 
                 print(f"    - 正在合并 '{duplicate_id}' -> '{primary_id}'...")
-                query = """
-                MATCH (primary {id: $primary_id}), (duplicate {id: $duplicate_id})
-                CALL apoc.refactor.mergeNodes([primary, duplicate], {
+                registry = self.entity_registry
+                query = f"""
+                MATCH {self._node_pattern("primary", "$primary_id", registry.label_of(primary_id))}
+                MATCH {self._node_pattern("duplicate", "$duplicate_id", registry.label_of(duplicate_id))}
+                CALL apoc.refactor.mergeNodes([primary, duplicate], {{
                     properties: 'combine', 
                     mergeRels: true
-                })
+                }})
                 YIELD node
                 RETURN count(node) as merged_count
                 """
@@ -151,6 +268,7 @@ class Neo4jDatabase:
                     summary = result.consume()
                     if summary.counters.nodes_deleted > 0:
                         print(f"      成功合并并删除了节点 '{duplicate_id}'。")
+                        registry.merge(duplicate_id, primary_id)
                     else:
                         print(f"      警告: 未找到或未能合并节点 '{duplicate_id}'。")
                 except Exception as e:
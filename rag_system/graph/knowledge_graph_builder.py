@@ -3,24 +3,41 @@
 遵循SOLID原则的主要协调器类，组合其他专门的类来完成图谱构建
 采用依赖注入和组合模式
 """
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
+from .data_structure import KnowledgeGraph
 from .graph_database import Neo4jDatabase
+from .entity_registry import triple_mentions
 from .entity_extractor import EntityExtractor
 from .graph_processor import GraphProcessor
 from .query_engine import GraphQueryEngine
 from .entity_merger import EntityMerger
+from ..core.llm_gateway import LLMGateway
+
+
+def _component_client(client, component: str, async_client: bool = False):
+    """传入的是 LLMGateway 时，为各组件取带组件名的客户端视图（用于按组件开启缓存和统计）"""
+    return client.client_for(component, async_client) if isinstance(client, LLMGateway) else client
 
 
 class KnowledgeGraphBuilder:
     """知识图谱构建器 - 主要协调器类"""
     
-    def __init__(self, llm_client, model_name: str, neo4j_config: dict):
+    def __init__(self, llm_client, model_name: str, neo4j_config: dict, async_llm_client=None,
+                 extraction_workers: int = 1, candidate_entities: int | None = 50):
+        """
+        :param extraction_workers: process_document 中并行做 LLM 抽取的 chunk 数，1 表示逐个处理
+        :param candidate_entities: 结构化提示词中最多放入的已有实体数，None 表示放入全部实体
+        """
         # 初始化各个专门的组件
         self.graph_db = Neo4jDatabase(neo4j_config['uri'], neo4j_config['auth'])
-        self.entity_extractor = EntityExtractor(llm_client, model_name)
-        self.graph_processor = GraphProcessor(llm_client, model_name)
-        self.query_engine = GraphQueryEngine(llm_client, model_name, self.graph_db)
-        self.entity_merger = EntityMerger(llm_client, model_name, self.graph_db)
+        self.entity_extractor = EntityExtractor(_component_client(llm_client, "entity_extractor"), model_name)
+        self.graph_processor = GraphProcessor(_component_client(llm_client, "graph_processor"), model_name)
+        self.query_engine = GraphQueryEngine(_component_client(llm_client, "query_engine"), model_name, self.graph_db,
+                                             async_client=_component_client(async_llm_client, "query_engine", True))
+        self.entity_merger = EntityMerger(_component_client(llm_client, "entity_merger"), model_name, self.graph_db)
+        self.extraction_workers = max(1, extraction_workers)
+        self.candidate_entities = candidate_entities
         
         # 文档级实体映射表：{filename: {entity_name: canonical_id}}
         self.document_entities: Dict[str, Dict[str, str]] = {}
@@ -28,6 +45,10 @@ class KnowledgeGraphBuilder:
     def close(self):
         """关闭数据库连接"""
         self.graph_db.close()
+
+    async def aclose(self):
+        """关闭当前事件循环的异步驱动"""
+        await self.graph_db.aclose()
         
     # 移除__del__方法，避免重复关闭
     # 实际的资源管理由Neo4jDatabase负责
@@ -39,44 +60,71 @@ class KnowledgeGraphBuilder:
         2. 将三元组结构化并进行实体消歧。
         3. 校验并写入数据库。
         """
+        graph = self.extract_chunk_graph(filename, text, doc_entities_mapping)
+        if graph is not None:
+            self.graph_db.insert_graph(graph, source_doc_id=filename)
+
+    def extract_chunk_graph(self, filename: str, text: str,
+                            doc_entities_mapping: Dict[str, str] | None = None) -> KnowledgeGraph | None:
+        """步骤 1-3 中只调用 LLM 和校验的部分（不写数据库），可在多个线程中并行执行"""
         # 第一步：粗提取
         raw_triples_str = self.entity_extractor.extract_raw_triples(
             text, filename, doc_entities_mapping
         )
         if not raw_triples_str or not raw_triples_str.strip():
             print(f"步骤 1: 未能从文本中提取到任何有效的三元组，处理终止。")
-            return
+            return None
 
         # 第二步：结构化与消歧
-        existing_entities = self.graph_db.get_existing_entities()
-        # 将文档级实体也加入到现有实体列表中，供消歧阶段使用
-        if doc_entities_mapping:
-            existing_entities.extend(doc_entities_mapping.values())
-            
+        existing_entities = self.select_candidate_entities(raw_triples_str, doc_entities_mapping)
+
         function_call = self.graph_processor.structure_and_disambiguate_graph(
             raw_triples_str, existing_entities
         )
         if not function_call:
             print(f"步骤 2: LLM 未能将三元组结构化，处理终止。")
-            return
+            return None
 
-        # 第三步：代码校验与写入
+        # 第三步：代码校验
         try:
-            graph = self.graph_processor.build_graph(function_call)
-            self.graph_db.insert_graph(graph, source_doc_id=filename)
+            return self.graph_processor.build_graph(function_call)
         except Exception as e:
             print(f"!!! 步骤 3: Pydantic 最终校验失败，LLM 输出格式仍有问题: {e}")
             print(f"原始图谱数据: {function_call.arguments}")
+            return None
 
-    def process_document(self, filename: str, full_text: str, chunks: List[str]):
+    def select_candidate_entities(self, raw_triples_str: str,
+                                  doc_entities_mapping: Dict[str, str] | None = None) -> List[str]:
+        """
+        为结构化与消歧阶段挑选已有实体（含文档级实体）。
+        按三元组中主体/客体与实体 id 的字符 n-gram 相似度取前 candidate_entities 个，提示词长度不随图谱规模增长。
+        """
+        doc_entities = list(doc_entities_mapping.values()) if doc_entities_mapping else []
+        if not self.candidate_entities:
+            # 将文档级实体也加入到现有实体列表中，供消歧阶段使用
+            return self.graph_db.get_existing_entities() + doc_entities
+        return self.graph_db.entity_registry.similar(
+            triple_mentions(raw_triples_str), self.candidate_entities, extra_ids=doc_entities
+        )
+
+    def process_document(self, filename: str, full_text: str, chunks: List[str], workers: int | None = None,
+                         chunk_ids: List[str] | None = None,
+                         doc_entities_mapping: Dict[str, str] | None = None) -> dict:
         """
         文档级处理方法：先进行文档级实体识别，再逐chunk构建图谱。
         这是解决分块粒度与图谱提取粒度不一致问题的核心方法。
+        workers > 1 时各 chunk 的两次 LLM 调用并行执行，Neo4j 写入仍在当前线程按 chunk 顺序串行进行；
+        同一文档内并行的 chunk 彼此看不到对方新写入的实体，依靠文档级实体映射和后处理合并来对齐。
+        :param workers: 并行抽取的 chunk 数，None 表示使用 extraction_workers
+        :param chunk_ids: 与 chunks 对应的 chunk id；给出时图谱数据按 chunk id 标记来源，可以按 chunk 撤回
+        :param doc_entities_mapping: 已有的文档级实体映射（增量更新时复用），给出时跳过文档级实体识别
+        :return: {"chunks", "written", "empty", "failed"} 统计，单个 chunk 出错不会中断整个文档
         """
         print(f"\n=== 开始处理文档 {filename} ===\n")
         
         # 步骤0：文档级实体识别
-        doc_entities_mapping = self.entity_extractor.extract_document_entities(filename, full_text)
+        if not doc_entities_mapping:
+            doc_entities_mapping = self.entity_extractor.extract_document_entities(filename, full_text)
         if doc_entities_mapping:
             # 存储到实例变量中，供后续chunk处理使用
             self.document_entities[filename] = doc_entities_mapping
@@ -86,29 +134,73 @@ class KnowledgeGraphBuilder:
             self.document_entities[filename] = {}
         
         # 步骤1-3：逐chunk处理，使用文档级实体映射
-        for i, chunk in enumerate(chunks):
+        stats = {"chunks": len(chunks), "written": 0, "empty": 0, "failed": 0}
+        workers = min(workers or self.extraction_workers, len(chunks)) or 1
+
+        def write(i, graph_or_error):
+            if isinstance(graph_or_error, Exception):
+                stats["failed"] += 1
+                print(f"!!! 第 {i+1}/{len(chunks)} 个chunk抽取失败，已跳过: {graph_or_error}")
+                return
+            if graph_or_error is None:
+                stats["empty"] += 1
+                return
+            try:
+                self.graph_db.insert_graph(graph_or_error, source_doc_id=chunk_ids[i] if chunk_ids else filename)
+                stats["written"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"!!! 第 {i+1}/{len(chunks)} 个chunk写入失败，已跳过: {e}")
+
+        def extract(i, chunk):
             print(f"\n--- 处理第 {i+1}/{len(chunks)} 个chunk ---")
-            self.process_single_chunk(filename, chunk, doc_entities_mapping)
-        
-        print(f"\n=== 文档 {filename} 处理完成 ===\n")
+            try:
+                return self.extract_chunk_graph(filename, chunk, doc_entities_mapping)
+            except Exception as e:
+                return e
+
+        if workers == 1:
+            for i, chunk in enumerate(chunks):
+                write(i, extract(i, chunk))
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="graph-extract") as pool:
+                futures = [pool.submit(extract, i, chunk) for i, chunk in enumerate(chunks)]
+                # 按 chunk 顺序依次写入：前面的 chunk 写库时，后面的 chunk 仍在抽取
+                for i, future in enumerate(futures):
+                    write(i, future.result())
+
+        print(f"\n=== 文档 {filename} 处理完成：写入 {stats['written']} 个chunk，"
+              f"无结果 {stats['empty']} 个，失败 {stats['failed']} 个 ===\n")
+        return stats
     
     def execute_post_processing(self):
         """执行后处理合并"""
         self.entity_merger.execute_post_processing()
     
-    def delete_document(self, filename: str):
-        """删除指定文档的图谱数据"""
-        self.graph_db.delete_source_documents(filename)
+    def delete_document(self, filename: str, chunk_ids: List[str] | None = None):
+        """删除指定文档的图谱数据（按文件名和按 chunk id 标记的来源都会被移除）"""
+        self.graph_db.delete_source_documents([filename] + list(chunk_ids or []))
         # 清理文档级实体映射
         if filename in self.document_entities:
             del self.document_entities[filename]
     
+    def retract_chunks(self, chunk_ids: List[str]):
+        """撤回指定 chunk 贡献的图谱数据，其他 chunk 仍在引用的节点和边保留"""
+        self.graph_db.delete_source_documents(chunk_ids)
+
     def query_graph(self, question: str):
         """查询图谱"""
         context = self.query_engine.query_graph(question)
         if not context:
             return "抱歉，根据您的问题生成的Cypher查询在知识图谱中没有返回任何结果。请尝试换一种问法。"
         return context
+
+    async def aquery_graph(self, question: str):
+        """异步查询图谱"""
+        context = await self.query_engine.aquery_graph(question)
+        if not context:
+            return "抱歉，根据您的问题生成的Cypher查询在知识图谱中没有返回任何结果。请尝试换一种问法。"
+        return context
     
     def get_graph_schema(self) -> dict:
         """获取图谱Schema信息"""
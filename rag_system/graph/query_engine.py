@@ -3,6 +3,7 @@
 负责Schema检索、Cypher生成和查询执行
 遵循单一职责原则
 """
+import asyncio
 import json
 from typing import List, Dict
 from .graph_database import Neo4jDatabase
@@ -11,23 +12,62 @@ from ..text.multiquery_generator import MultiqueryGenerator
 class GraphQueryEngine:
     """图谱查询引擎，专门负责图谱查询相关功能"""
     
-    def __init__(self, llm_client, model_name: str, graph_db: Neo4jDatabase):
+    def __init__(self, llm_client, model_name: str, graph_db: Neo4jDatabase, async_client=None):
+        """
+        :param async_client: 可选的 AsyncOpenAI 客户端，供 aquery_graph 使用
+        """
         self.client = llm_client
+        self.async_client = async_client
         self.model = model_name
         self.graph_db = graph_db
-        self.multi_query_generator = MultiqueryGenerator(llm_client, model_name, verbose=False)
+        self.multi_query_generator = MultiqueryGenerator(llm_client, model_name, verbose=False,
+                                                         async_client=async_client)
+
+    def _chat(self, messages, **kwargs):
+        return self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+
+    async def _achat(self, messages, **kwargs):
+        if self.async_client is None:
+            return await asyncio.to_thread(self._chat, messages, **kwargs)
+        return await self.async_client.chat.completions.create(model=self.model, messages=messages, **kwargs)
     
     def retrieve_relevant_schema(self, question: str) -> Dict:
         """
         根据用户问题，从完整的 Schema 和实体列表中，检索出最相关的子集。
         """
         schema_dict = self.graph_db.get_graph_schema()
+        existing_entities = self.graph_db.get_existing_entities()
+        expanded_queries = self.multi_query_generator.expand(question, num_queries=3)
+        response = self._chat(
+            self._schema_messages(question, schema_dict, existing_entities, expanded_queries),
+            temperature=0.0,
+            response_format={"type": "json_object"}
+        )
+        return self._parse_schema(response)
+
+    async def aretrieve_relevant_schema(self, question: str) -> Dict:
+        """retrieve_relevant_schema 的异步版本：查询扩展与两次 Schema 读取并发进行"""
+        expanded_queries, schema_dict, existing_entities = await asyncio.gather(
+            self.multi_query_generator.aexpand(question, num_queries=3),
+            self.graph_db.aget_graph_schema(),
+            self.graph_db.aget_existing_entities(),
+        )
+        response = await self._achat(
+            self._schema_messages(question, schema_dict, existing_entities, expanded_queries),
+            temperature=0.0,
+            response_format={"type": "json_object"}
+        )
+        return self._parse_schema(response)
+
+    @staticmethod
+    def _schema_messages(question: str, schema_dict: Dict, existing_entities: List[str],
+                         expanded_queries: List[str]) -> List[Dict]:
         schema_for_prompt = f"""
         - **节点标签**: {schema_dict.get('node_labels', [])}
         - **关系类型**: {schema_dict.get('relationship_types', [])}
         """
-        existing_entities = self.graph_db.get_existing_entities()
         entities_list_str = str(existing_entities)
+        expanded_str = '\n\t'.join(expanded_queries)
 
         prompt = f"""
         你是一个图谱数据检索专家。你的任务是根据用户的这几个问题，从下面提供的"可用数据"中，挑选出可能相关的节点标签、关系类型和实体ID。
@@ -45,19 +85,16 @@ class GraphQueryEngine:
         ### 用户问题:
         ---
         {question}
-        {'\n\t'.join(self.multi_query_generator.expand(question, num_queries=3))}
+        {expanded_str}
         ---
         """
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "你是一个图谱数据检索专家，专注于根据问题筛选相关数据。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.0,
-            response_format={"type": "json_object"}
-        )
+        return [
+            {"role": "system", "content": "你是一个图谱数据检索专家，专注于根据问题筛选相关数据。"},
+            {"role": "user", "content": prompt}
+        ]
 
+    @staticmethod
+    def _parse_schema(response) -> Dict:
         try:
             raw_content = response.choices[0].message.content
             result = json.loads(raw_content)
@@ -69,6 +106,16 @@ class GraphQueryEngine:
     
     def generate_cypher_query(self, question: str, context_info: Dict) -> str:
         """根据问题和上下文信息生成Cypher查询"""
+        cypher_response = self._chat(self._cypher_messages(question, context_info), temperature=0.0)
+        return self._clean_cypher(cypher_response.choices[0].message.content)
+
+    async def agenerate_cypher_query(self, question: str, context_info: Dict) -> str:
+        """generate_cypher_query 的异步版本"""
+        cypher_response = await self._achat(self._cypher_messages(question, context_info), temperature=0.0)
+        return self._clean_cypher(cypher_response.choices[0].message.content)
+
+    @staticmethod
+    def _cypher_messages(question: str, context_info: Dict) -> List[Dict]:
         context_for_prompt = f"""
         - **相关节点标签**: {context_info.get('node_labels', [])}
         - **相关关系类型**: {context_info.get('relationship_types', [])}
@@ -121,17 +168,13 @@ class GraphQueryEngine:
         ---
         直接输出一个简洁有效的 Cypher 查询，不要输出多余的内容。优先使用单跳查询，除非问题明确需要多跳。
         """
+        return [
+            {"role": "system", "content": "你是一个精通Cypher查询语言的专家，会根据提供的图谱生成多段查询代码。"},
+            {"role": "user", "content": cypher_generation_prompt}
+        ]
 
-        cypher_response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "你是一个精通Cypher查询语言的专家，会根据提供的图谱生成多段查询代码。"},
-                {"role": "user", "content": cypher_generation_prompt}
-            ],
-            temperature=0.0
-        )
-        
-        cypher_query = cypher_response.choices[0].message.content.strip()
+    def _clean_cypher(self, content: str) -> str:
+        cypher_query = content.strip()
 
         # 清理Cypher查询格式
         if cypher_query.startswith("```"):
@@ -221,53 +264,87 @@ class GraphQueryEngine:
                 
                 if attempt < max_retries - 1:
                     # 还有重试机会，尝试用错误信息重新生成
-                    retry_prompt = f"""
-                    你之前生成的Cypher查询执行失败了。
-                    
-                    **失败的查询**:
-                    ```cypher
-                    {cypher_query}
-                    ```
-                    
-                    **错误信息**: {error_msg}
-                    
-                    **常见错误修复**:
-                    - 如果提示变量未定义（如 path），要么定义它（MATCH path = ...），要么不使用它
-                    - 不要在单跳查询中使用 relationships(path)
-                    - 检查语法错误，如多余的逗号、括号不匹配等
-                    
-                    **与问题相关的 Schema**:
-                    - 节点标签: {relevant_context.get('node_labels', [])}
-                    - 关系类型: {relevant_context.get('relationship_types', [])}
-                    - 实体ID: {relevant_context.get('entity_ids', [])}
-                    
-                    **用户问题**: {question}
-                    
-                    请生成一个修复后的、更简单的Cypher查询。优先使用最基础的单跳MATCH查询。
-                    """
-                    
-                    retry_response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {"role": "system", "content": "你是一个精通Cypher查询语言的专家，擅长根据错误信息修复查询。"},
-                            {"role": "user", "content": retry_prompt}
-                        ],
+                    retry_response = self._chat(
+                        self._retry_messages(question, cypher_query, error_msg, relevant_context),
                         temperature=0.0
                     )
-                    
-                    cypher_query = retry_response.choices[0].message.content.strip()
-                    
-                    # 清理代码块标记
-                    if cypher_query.startswith("```"):
-                        lines = cypher_query.split('\n')
-                        cypher_query = '\n'.join(lines[1:-1]) if len(lines) > 2 else cypher_query[3:]
-                    if cypher_query.endswith("```"):
-                        cypher_query = cypher_query[:-3].strip()
-                    
-                    cypher_query = self._validate_and_fix_cypher(cypher_query)
-                    print(f"\n[重试生成的Cypher] {cypher_query}")
+                    cypher_query = self._clean_retry_cypher(retry_response.choices[0].message.content)
                 else:
                     # 最后一次尝试失败
                     return []
         
-        return []
\ No newline at end of file
+        return []
+
+    async def aquery_graph(self, question: str) -> List[Dict]:
+        """query_graph 的异步版本：LLM 调用走异步客户端，Cypher 走 Neo4j 异步驱动"""
+        relevant_context = await self.aretrieve_relevant_schema(question)
+        if not relevant_context.get("node_labels") and not relevant_context.get("relationship_types"):
+            print("[ERROR] 未找到相关Schema，无法构建查询")
+            return []
+
+        cypher_query = await self.agenerate_cypher_query(question, relevant_context)
+
+        max_retries = 2
+        for attempt in range(max_retries):
+            try:
+                context = await self.graph_db.aexecute_cypher(cypher_query)
+                print(f"\n[查询结果] {context}\n")
+                return context
+            except Exception as e:
+                error_msg = str(e)
+                print(f"[ERROR] Cypher执行失败 (尝试 {attempt + 1}/{max_retries}): {error_msg}")
+                if attempt < max_retries - 1:
+                    retry_response = await self._achat(
+                        self._retry_messages(question, cypher_query, error_msg, relevant_context),
+                        temperature=0.0
+                    )
+                    cypher_query = self._clean_retry_cypher(retry_response.choices[0].message.content)
+                else:
+                    return []
+
+        return []
+
+    @staticmethod
+    def _retry_messages(question: str, cypher_query: str, error_msg: str, relevant_context: Dict) -> List[Dict]:
+        retry_prompt = f"""
+        你之前生成的Cypher查询执行失败了。
+        
+        **失败的查询**:
+        ```cypher
+        {cypher_query}
+        ```
+        
+        **错误信息**: {error_msg}
+        
+        **常见错误修复**:
+        - 如果提示变量未定义（如 path），要么定义它（MATCH path = ...），要么不使用它
+        - 不要在单跳查询中使用 relationships(path)
+        - 检查语法错误，如多余的逗号、括号不匹配等
+        
+        **与问题相关的 Schema**:
+        - 节点标签: {relevant_context.get('node_labels', [])}
+        - 关系类型: {relevant_context.get('relationship_types', [])}
+        - 实体ID: {relevant_context.get('entity_ids', [])}
+        
+        **用户问题**: {question}
+        
+        请生成一个修复后的、更简单的Cypher查询。优先使用最基础的单跳MATCH查询。
+        """
+        return [
+            {"role": "system", "content": "你是一个精通Cypher查询语言的专家，擅长根据错误信息修复查询。"},
+            {"role": "user", "content": retry_prompt}
+        ]
+
+    def _clean_retry_cypher(self, content: str) -> str:
+        cypher_query = content.strip()
+
+        # 清理代码块标记
+        if cypher_query.startswith("```"):
+            lines = cypher_query.split('\n')
+            cypher_query = '\n'.join(lines[1:-1]) if len(lines) > 2 else cypher_query[3:]
+        if cypher_query.endswith("```"):
+            cypher_query = cypher_query[:-3].strip()
+
+        cypher_query = self._validate_and_fix_cypher(cypher_query)
+        print(f"\n[重试生成的Cypher] {cypher_query}")
+        return cypher_query
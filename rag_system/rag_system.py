@@ -1,42 +1,59 @@
+import asyncio
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from google import genai
-from openai import OpenAI
-from neo4j import GraphDatabase
+from typing import Dict, List
 
 from .core.database import KnowledgeDatabase
 from .text.retriever import Retriever
 from .text.reranker import Reranker
+from .text.rerank_scheduler import RerankScheduler
 from .generation.compressor import Compressor
 from .generation.generator import Generator
 from .utils.text_utils import TextProcessor
 from .core.config import RAGConfig
 from .text.multiquery_generator import MultiqueryGenerator
 from .core.embedder import Embedder
-from .graph.Data2Neo4j import Data2Neo4j
+from .core.embedding_cache import EmbeddingCache
+from .core.local_embedder import LocalEmbedder
+from .core.llm_gateway import LLMGateway, LLMResponseCache
+from .utils.lazy import Lazy, LoopLocal
+from .utils.rate_limit import TokenBucket
 
 class RAGSystem:
     def __init__(self, config: RAGConfig):
         self.config = config
-        ebd_client = genai.Client(api_key=config.gemini_api_key)
-        llm_client = OpenAI(api_key=os.environ.get("DEEPSEEK_API_KEY"),
-                                base_url='https://api.deepseek.com')
-        neo_driver = {'uri': config.neo4j_uri,'auth': config.neo4j_auth}
-        try:
-            self.neo = Data2Neo4j(llm_client, config.llm_model_name, neo_driver)
-        except Exception as e:
-            raise RuntimeError(f"Neo4j初始化出错：{str(e)}，请检查服务/配置！")
-
-        self.embedder = Embedder(ebd_client, config.embedding_model_name)
-        # 初始化数据库
+        # 各组件在第一次用到时才创建：只做关键词检索的进程不会加载交叉编码器、连接 Neo4j 或创建 API 客户端
+        self._llm_client = Lazy(lambda: self._create_llm_client(async_client=False))
+        # 异步客户端绑定事件循环，每个事件循环各自创建（多次 asyncio.run(aquery(...)) 互不影响）
+        self._async_llm_client = LoopLocal(lambda: self._create_llm_client(async_client=True))
+        # 所有 LLM 调用都经过网关（带响应缓存）；组件拿到的是网关的客户端视图，真正的客户端仍在首次调用时创建
+        self._llm_gateway = Lazy(self._create_llm_gateway)
+        self._neo = Lazy(self._create_neo)
+        self._embedder = Lazy(self._create_embedder)
+        self._query_expander = Lazy(lambda: MultiqueryGenerator(self._llm("query_expander"), config.llm_model_name,
+                                                                async_client=self._llm("query_expander", True)))
+        self._reranker = Lazy(self._create_reranker)
+        self._compressor = Lazy(lambda: Compressor(self._llm("compressor"), config.llm_model_name,
+                                                   verbose=config.verbose,
+                                                   async_client=self._llm("compressor", True)))
+        self._generator = Lazy(lambda: Generator(self._llm("generator"), config.llm_model_name,
+                                                 async_client=self._llm("generator", True)))
+
+        # 初始化数据库（截断维度不同的向量不能放在同一个 collection 里）；BM25 等派生索引在首次检索时打开
+        collection_name = config.embedding_model_name.replace("/", "_").replace("\\", "_").strip("._")
+        if config.embedding_dim:
+            collection_name = f"{collection_name}_d{config.embedding_dim}"
         self.db = KnowledgeDatabase(
             db_path=config.db_path,
-            collection_name=config.embedding_model_name.replace("/", "_"),
+            collection_name=collection_name,
             verbose=config.verbose,
+            tokenize_workers=config.tokenize_workers,
+            vector_quantization=config.vector_quantization,
+            rescore_multiplier=config.rescore_multiplier,
+            vector_backend=config.vector_backend,
         )
-        self.db.rebuild_bm25()
-
-        query_expander = MultiqueryGenerator(llm_client, config.llm_model_name)
 
         # 注意：这里应该使用 config.embedding_model_name（实例属性），而不是 RAGConfig.embedding_model_name（类属性）
         # collection 已经在 self.db 初始化时创建了，这里是重复获取（可以删除）
@@ -44,10 +61,149 @@ class RAGSystem:
         # self.collection = self.db.chroma_client.get_or_create_collection(name=collection_name)
 
         # 初始化模块
-        self.retriever = Retriever(self.db, embedder=self.embedder, query_expander=query_expander, verbose=config.verbose)
-        self.reranker = Reranker(config.reranker_model_name)
-        self.compressor = Compressor(llm_client, config.llm_model_name, verbose=config.verbose)
-        self.generator = Generator(llm_client, config.llm_model_name)
+        self.retriever = Retriever(
+            self.db, embedder=self._embedder, query_expander=self._query_expander, verbose=config.verbose,
+            executor=ThreadPoolExecutor(max_workers=config.retrieval_workers, thread_name_prefix="retrieval"),
+            leg_timeout=config.retrieval_leg_timeout, fusion_weights=config.fusion_weights, rrf_k=config.rrf_k,
+        )
+        if not config.lazy_init:
+            self.warmup()
+
+    # ================= 组件（首次使用时创建） =================
+
+    @property
+    def llm_client(self):
+        return self._llm_client.get()
+
+    @property
+    def async_llm_client(self):
+        """当前事件循环的异步客户端（与同步客户端共用配置），只能在协程中访问"""
+        return self._async_llm_client.get()
+
+    @property
+    def llm_gateway(self) -> LLMGateway:
+        return self._llm_gateway.get()
+
+    def _llm(self, component: str, async_client: bool = False):
+        return self.llm_gateway.client_for(component, async_client)
+
+    @property
+    def neo(self):
+        return self._neo.get()
+
+    @property
+    def embedder(self):
+        return self._embedder.get()
+
+    @property
+    def reranker(self):
+        return self._reranker.get()
+
+    @property
+    def compressor(self):
+        return self._compressor.get()
+
+    @property
+    def generator(self):
+        return self._generator.get()
+
+    @staticmethod
+    def _create_llm_client(async_client: bool):
+        from openai import AsyncOpenAI, OpenAI
+        client_cls = AsyncOpenAI if async_client else OpenAI
+        return client_cls(api_key=os.environ.get("DEEPSEEK_API_KEY"), base_url='https://api.deepseek.com')
+
+    def _create_llm_gateway(self):
+        config = self.config
+        cache = None
+        if config.llm_cache and config.llm_cache_components != []:  # 没有组件开启缓存时不打开缓存文件
+            cache = LLMResponseCache(Path(config.db_path) / "llm_cache.sqlite3", ttl=config.llm_cache_ttl,
+                                     max_entries=config.llm_cache_max_entries)
+        return LLMGateway(self._llm_client, self._async_llm_client, cache=cache,
+                          cached_components=config.llm_cache_components)
+
+    def _create_neo(self):
+        from .graph import Data2Neo4j
+        neo_driver = {'uri': self.config.neo4j_uri, 'auth': self.config.neo4j_auth}
+        try:
+            return Data2Neo4j(self.llm_gateway, self.config.llm_model_name, neo_driver,
+                              async_client=self.llm_gateway,
+                              extraction_workers=self.config.graph_extraction_workers,
+                              candidate_entities=self.config.graph_candidate_entities)
+        except Exception as e:
+            raise RuntimeError(f"Neo4j初始化出错：{str(e)}，请检查服务/配置！")
+
+    def _create_embedder(self):
+        config = self.config
+        embedding_cache = None
+        if config.embedding_cache:
+            embedding_cache = EmbeddingCache(
+                Path(config.db_path) / "embedding_cache.sqlite3",
+                memory_bytes=config.embedding_cache_memory_mb * 1024 * 1024,
+                max_entries=config.embedding_cache_max_entries,
+            )
+        if config.embedding_backend == "local":
+            return LocalEmbedder(
+                config.embedding_model_name,
+                cache=embedding_cache,
+                threads=config.local_embedding_threads,
+                quantize=config.local_embedding_quantize,
+                batch_chars=config.local_embedding_batch_chars,
+                output_dim=config.embedding_dim,
+            )
+        elif config.embedding_backend == "gemini":
+            from google import genai
+            ebd_client = genai.Client(api_key=config.gemini_api_key)
+            rate_limiter = TokenBucket(config.embedding_rate_limit) if config.embedding_rate_limit else None
+            # aio 客户端的连接池绑定事件循环，每个事件循环各自创建，由 aclose 关闭
+            async_client = LoopLocal(lambda: genai.Client(api_key=config.gemini_api_key).aio)
+            return Embedder(ebd_client, config.embedding_model_name, cache=embedding_cache,
+                            rate_limiter=rate_limiter, max_retries=config.embedding_max_retries,
+                            output_dim=config.embedding_dim, async_client=async_client)
+        raise ValueError(f"未知的 embedding_backend: {config.embedding_backend}")
+
+    def _create_reranker(self):
+        config = self.config
+        reranker = Reranker(
+            config.reranker_model_name,
+            batch_size=config.rerank_batch_size,
+            candidate_budget=config.rerank_candidate_budget,
+            first_stage_model=config.rerank_first_stage_model,
+            early_exit_patience=config.rerank_early_exit_patience,
+            backend=config.reranker_backend,
+            onnx_dir=Path(config.db_path) / "onnx",
+            threads=config.reranker_threads,
+            max_length=config.reranker_max_length,
+            onnx_quantization=config.reranker_onnx_quantization,
+        )
+        if config.rerank_micro_batch:
+            reranker = RerankScheduler(reranker, max_batch_size=config.rerank_max_batch_size,
+                                       max_wait_ms=config.rerank_max_wait_ms)
+        return reranker
+
+    def warmup(self, components=None) -> Dict[str, float]:
+        """
+        预先创建组件并打开索引，避免第一次查询承担初始化开销。
+        :param components: 要预热的组件名列表，None 表示全部
+        :return: {组件名: 耗时秒数}
+        """
+        steps = {
+            "indexes": self.db.ensure_indexes,
+            "embedder": lambda: self.embedder,
+            "reranker": lambda: self.reranker.rerank("warmup", ["warmup"], 1),  # 跑一次前向，完成惰性初始化
+            "llm_client": lambda: (self.llm_client, self.llm_gateway),  # 异步客户端要在事件循环中创建
+            "neo": lambda: self.neo,
+            "compressor": lambda: self.compressor,
+            "generator": lambda: self.generator,
+        }
+        timings = {}
+        for name in components or steps:
+            start = time.perf_counter()
+            steps[name]()
+            timings[name] = time.perf_counter() - start
+            if self.config.verbose:
+                print(f"[预热] {name}: {timings[name]:.2f}s")
+        return timings
 
     # ================= 知识库管理 =================
 
@@ -57,9 +213,20 @@ class RAGSystem:
 
         print(f"开始处理知识库文件：{filepath}")
         text = TextProcessor.read_file(filepath)
-        chunks = TextProcessor.split_text(text, language=language)
+        ids, chunks = self.db.chunk_ids(filename, TextProcessor.split_text(text, language=language))
+
+        manifest = self.db.get_manifest(filename)
+        if manifest is not None:
+            # 已入库的文档：按清单对比，文件改动后被删掉的 chunk 也要撤回
+            self._apply_chunk_diff(filename, text, ids, chunks, manifest)
+            print(f"文档 {filename} 添加完成 ✅")
+            return
+
+        stale_ids = set(self.db.collection.get(where={"source": filename}, include=[])['ids']) - set(ids)
+        if stale_ids:  # 旧版本按位置编号的 chunk id，先整体删除再按内容寻址的 id 重新入库
+            print(f"文档 {filename} 使用旧版本的 chunk id，将重新入库")
+            self.remove_corpus(filename)
 
-        ids = [f"{filename}_{i}" for i in range(len(chunks))]
         existing_ids = set(self.db.collection.get(ids=ids)['ids'])
         print(f"在数据库中找到了{len(existing_ids)}个已存在的块")
 
@@ -69,105 +236,280 @@ class RAGSystem:
                 new_docs.append(doc)
                 new_ids.append(ids[i])
         if not new_docs:
+            self.db.set_manifest(filename, ids)
             print("所有文本块都已完成存于数据库，无需添加。\n")
             return
 
         print(f"向数据库中添加{len(new_docs)}个新文本块……")
-        
+        entities = self._ingest_chunks(filename, text, new_docs, new_ids)
+        self.db.set_manifest(filename, ids, entities)
+
+        # 执行后处理合并
+        self.neo.after_processing()
+
+        self.db.save_indexes()
+        print(f"文档 {filename} 添加完成 ✅")
+
+    def _ingest_chunks(self, filename, text, docs, ids, doc_entities=None):
+        """抽取图谱并嵌入写入一组新 chunk，返回文档级实体映射"""
         # ========== 🔥 关键改进：使用文档级处理方法 ==========
-        # 使用新的process_document方法替代逐chunk调用process
-        self.neo.process_document(filename, text, new_docs)
+        # 使用新的process_document方法替代逐chunk调用process；图谱数据按 chunk id 标记来源
+        self.neo.process_document(filename, text, docs, chunk_ids=ids, doc_entities_mapping=doc_entities)
         
-        # 批量生成 embedding
-        batch_size = 100
-        for i in range(0, len(new_docs), batch_size):
-            batch = new_docs[i:i+batch_size]
-
-            embeddings = self.embedder.embed(batch, task_type="RETRIEVAL_DOCUMENT")
-            batch_ids = [f"{filename}_{i+j}" for j in range(len(batch))]
+        # 并发批量生成 embedding：写入当前批次时，后续批次仍在请求中
+        batch_size = self.config.embedding_batch_size
+        batches = [docs[i:i+batch_size] for i in range(0, len(docs), batch_size)]
+        id_batches = [ids[i:i+batch_size] for i in range(0, len(ids), batch_size)]
+        for b, embeddings in self.embedder.embed_batches(batches, task_type="RETRIEVAL_DOCUMENT",
+                                                         max_concurrency=self.config.embedding_concurrency):
+            batch = batches[b]
+            batch_ids = id_batches[b]
             metadatas = [{"source": filename} for _ in batch]
 
-            self.db.collection.add(
+            self.db.add_documents(
                 ids=batch_ids,
                 documents=batch,
                 embeddings=embeddings,
                 metadatas=metadatas,
             )
-
-        # 执行后处理合并
-        self.neo.after_processing()
-
-        self.db.rebuild_bm25()
-        print(f"文档 {filename} 添加完成 ✅")
+        return self.neo.document_entities.get(filename) or doc_entities or {}
 
     def remove_corpus(self, filename: str):
         """从知识库中删除指定文档"""
         if self.config.verbose:
             print(f"正在删除文档 {filename}…")
 
-        results = self.db.collection.get(where={"source": filename})
-        ids = results["ids"]
-        if ids:
-            self.db.collection.delete(ids=ids)
+        chunk_ids = self.db.delete_source(filename)  # BM25 索引同步增量移除
 
-        self.neo.delete_graph_from_sources(filename)
+        self.neo.delete_graph_from_sources(filename, chunk_ids)
+        self.db.drop_manifest(filename)
 
-        self.db.rebuild_bm25()
+        self.db.save_indexes()
         if self.config.verbose:
             print(f"文档 {filename} 删除完成 ✅")
 
     def update_corpus(self, filename: str, language="English"):
-        """更新知识库中的文档（先删除再添加）"""
+        """
+        更新知识库中的文档。
+        chunk id 由内容哈希决定，按来源清单对比新旧 chunk：只嵌入和抽取新增的 chunk，
+        只撤回被删除的 chunk（向量、BM25 和图谱中由它们贡献的数据），未变化的 chunk 原样保留。
+        文档级实体映射沿用上次入库的结果；没有清单的旧数据（按位置编号的 id）退化为先删除再添加。
+        """
         if self.config.verbose:
             print(f"正在更新文档 {filename}…")
 
-        self.remove_corpus(filename)
-        self.add_corpus(filename, language=language)
+        manifest = self.db.get_manifest(filename)
+        if manifest is None:
+            self.remove_corpus(filename)
+            self.add_corpus(filename, language=language)
+        else:
+            filepath = Path(self.config.knowledgebase_path) / filename
+            text = TextProcessor.read_file(filepath)
+            ids, chunks = self.db.chunk_ids(filename, TextProcessor.split_text(text, language=language))
+            self._apply_chunk_diff(filename, text, ids, chunks, manifest)
 
         if self.config.verbose:
             print(f"文档 {filename} 更新完成 ✅")
 
+    def _apply_chunk_diff(self, filename, text, ids, chunks, manifest):
+        """按来源清单对比新旧 chunk：撤回被删除的 chunk，只入库新增的 chunk，最后写回清单"""
+        old_ids, new_ids = set(manifest["chunks"]), set(ids)
+        removed = [i for i in manifest["chunks"] if i not in new_ids]
+        added = [(i, doc) for i, doc in zip(ids, chunks) if i not in old_ids]
+        print(f"新增 {len(added)} 个文本块，删除 {len(removed)} 个文本块，"
+              f"未变化 {len(ids) - len(added)} 个")
+
+        if removed:
+            self.db.delete_documents(removed)
+            self.neo.retract_chunks(removed)
+        entities = manifest.get("entities")
+        if added:
+            added_ids, added_docs = [list(x) for x in zip(*added)]
+            entities = self._ingest_chunks(filename, text, added_docs, added_ids, entities)
+        self.db.set_manifest(filename, ids, entities)
+        if added:
+            self.neo.after_processing()
+        self.db.save_indexes()
+
     # ================= 主查询接口 =================
 
+    _TEXT_MODES = ["vector", "keyword", "expand", "text_hybrid"]
+
     def query(self, query: str, k=10, top_n=4, mode="hybrid", compress=False, source_filter=None) -> str:
         """统一查询接口"""
         text_docs = []
-        graph_context = ""
-        if mode in ["vector", "keyword", "expand", "text_hybrid"]:
-            if mode == "vector":
-                text_docs = self.retriever.vector_search(query, k, source_filter=source_filter)
-            elif mode == "keyword":
-                text_docs = self.retriever.keyword_search(query, k)
-            elif mode == "expand":
-                text_docs = self.retriever.expand_search(query, k, source_filter=source_filter)
-            elif mode == "text_hybrid":
-                text_docs = self.retriever.text_hybrid_search(query, k, source_filter=source_filter)
-
+        if mode in self._TEXT_MODES or mode == "hybrid":
+            text_docs = self._candidates([query], k, mode, source_filter)[0]
             if text_docs:
                 text_docs = self.reranker.rerank(query, text_docs, top_n)
-                if compress:
-                    text_docs = self.compressor.compress(query, text_docs)
-            else:
-                return "文本中未找到相关信息"
+        elif mode != "graph":
+            return "Unknown search mode!"
 
-        elif mode == "graph":
+        return self._answer(query, text_docs, mode, compress)
+
+    @property
+    def candidate_limit(self) -> int | None:
+        """送入重排的候选数上限：fusion_top_k 与（无第一阶段模型时的）rerank_candidate_budget 取小"""
+        limits = [self.config.fusion_top_k]
+        if not self.config.rerank_first_stage_model:
+            limits.append(self.config.rerank_candidate_budget)
+        limits = [limit for limit in limits if limit]
+        return min(limits) if limits else None
+
+    def _candidates(self, queries, k, mode, source_filter) -> List[List[str]]:
+        """检索命中记录（只含 id 和分数），截断到候选上限后才取回文本"""
+        # text_hybrid / hybrid（默认模式）都走 text_hybrid
+        hit_lists = self.retriever.search_hits_batch(queries, mode, k, source_filter, top_k=self.candidate_limit)
+        return self.retriever.texts(hit_lists)
+
+    def _answer(self, query: str, text_docs: List[str], mode: str, compress: bool) -> str:
+        """重排之后的公共流程：压缩、图谱检索、生成"""
+        if mode in self._TEXT_MODES and not text_docs:
+            return "文本中未找到相关信息"
+        if text_docs and compress:
+            text_docs = self.compressor.compress(query, text_docs)
+
+        graph_context = ""
+        if mode in ["graph", "hybrid"]:
             graph_context = self.neo.query_graph_raw(query)
             graph_context = graph_context if graph_context else "知识图谱中未找到相关信息"
 
-        elif mode == "hybrid": # 默认模式
-            text_docs = self.retriever.text_hybrid_search(query, k, source_filter=source_filter)
+        if not text_docs and (not graph_context or "未找到" in graph_context):
+            return "文本和知识图谱中均未找到相关信息"
+
+        return self.generator.generate(query, text_docs, graph_context)
+
+    def query_batch(self, queries: List[str], k=10, top_n=4, mode="hybrid", compress=False, source_filter=None,
+                    max_concurrency=None) -> list:
+        """
+        批量查询接口，参数与 query 一致，适合离线评测和批量预生成答案。
+        每 embedding_batch_size 个查询合并成一次嵌入调用和一轮 BM25 打分，全部 (query, doc) 对
+        合并成大批次重排；图谱查询和答案生成以 max_concurrency 的并发度执行。
+        :return: 与 queries 顺序一致的结果列表；出错的查询在对应位置放异常对象，不影响其他查询
+        """
+        if mode not in self._TEXT_MODES + ["graph", "hybrid"]:
+            return ["Unknown search mode!" for _ in queries]
+
+        results = [None] * len(queries)
+        chunk_size = self.config.embedding_batch_size
+        with ThreadPoolExecutor(max_workers=max_concurrency or self.config.generation_concurrency) as pool:
+            futures = {}
+            for start in range(0, len(queries), chunk_size):
+                part = queries[start:start + chunk_size]
+                doc_lists = [[] for _ in part]
+                if mode != "graph":
+                    doc_lists = self._retrieve_batch(part, k, mode, source_filter, pool)
+                    doc_lists = self._rerank_batch(part, doc_lists, top_n)
+                # 生成在线程池中进行，同时继续处理下一组查询的检索
+                for i, (query, text_docs) in enumerate(zip(part, doc_lists)):
+                    if isinstance(text_docs, Exception):
+                        results[start + i] = text_docs
+                    else:
+                        futures[start + i] = pool.submit(self._answer, query, text_docs, mode, compress)
+            for i, future in futures.items():
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    results[i] = e
+
+        failed = sum(isinstance(r, Exception) for r in results)
+        if failed and self.config.verbose:
+            print(f"[批量查询] {len(queries)} 个查询中 {failed} 个出错")
+        return results
+
+    def _retrieve_batch(self, queries, k, mode, source_filter, pool):
+        if mode == "expand":  # 每个查询各自调用 LLM 扩展，并发执行
+            return self._isolated(lambda q: self._candidates([q], k, mode, source_filter)[0], queries, pool)
+        try:
+            return self._candidates(queries, k, mode, source_filter)
+        except Exception:
+            # 整批失败时逐个重试，让出错的查询只影响自己
+            return self._isolated(lambda q: self._candidates([q], k, mode, source_filter)[0], queries)
+
+    def _rerank_batch(self, queries, doc_lists, top_n):
+        todo = [i for i, docs in enumerate(doc_lists) if docs and not isinstance(docs, Exception)]
+        try:
+            reranked = self.reranker.rerank_batch([queries[i] for i in todo], [doc_lists[i] for i in todo], top_n)
+        except Exception:
+            reranked = self._isolated(lambda i: self.reranker.rerank(queries[i], doc_lists[i], top_n), todo)
+        doc_lists = list(doc_lists)
+        for i, docs in zip(todo, reranked):
+            doc_lists[i] = docs
+        return doc_lists
+
+    @staticmethod
+    def _isolated(fn, items, pool=None):
+        """逐个执行 fn，异常作为结果返回"""
+        def run(item):
+            try:
+                return fn(item)
+            except Exception as e:
+                return e
+        return list(pool.map(run, items)) if pool else [run(item) for item in items]
+
+    async def aquery(self, query: str, k=10, top_n=4, mode="hybrid", compress=False, source_filter=None) -> str:
+        """
+        异步查询接口，参数与 query 一致。
+        hybrid 模式下文本检索链路与图谱检索链路并发执行，总耗时约为较慢的一条链路。
+        LLM、嵌入和 Neo4j 走异步客户端；BM25、重排等本地计算放到线程里执行。
+        异步客户端按事件循环创建，调用方在事件循环结束前必须 await aclose()，否则连接池不会释放。
+        """
+        if mode not in ["vector", "keyword", "expand", "text_hybrid", "graph", "hybrid"]:
+            return "Unknown search mode!"
+
+        async def text_pipeline():
+            top_k = self.candidate_limit
+            if mode == "vector":
+                hits = (await self.retriever.avector_hits_batch([query], k, source_filter))[0][:top_k]
+            elif mode == "keyword":
+                hits = (await asyncio.to_thread(self.retriever.keyword_hits_batch, [query], k,
+                                                source_filter=source_filter))[0][:top_k]
+            elif mode == "expand":
+                hits = await asyncio.to_thread(self.retriever.expand_hits, query, k,
+                                               source_filter=source_filter, top_k=top_k)
+            else:
+                hits = await self.retriever.ahybrid_hits(query, k, source_filter, top_k)
+            text_docs = (await asyncio.to_thread(self.retriever.texts, [hits]))[0]
             if text_docs:
-                text_docs = self.reranker.rerank(query, text_docs, top_n)
+                text_docs = await asyncio.to_thread(self.reranker.rerank, query, text_docs, top_n)
                 if compress:
-                    text_docs = self.compressor.compress(query, text_docs)
+                    text_docs = await self.compressor.acompress(query, text_docs)
+            return text_docs
 
-            graph_context = self.neo.query_graph_raw(query)
-            graph_context = graph_context if graph_context else "知识图谱中未找到相关信息"
+        async def graph_pipeline():
+            graph_context = await self.neo.aquery_graph_raw(query)
+            return graph_context if graph_context else "知识图谱中未找到相关信息"
 
+        text_docs = []
+        graph_context = ""
+        if mode == "graph":
+            graph_context = await graph_pipeline()
+        elif mode == "hybrid":  # 默认模式
+            text_docs, graph_context = await asyncio.gather(text_pipeline(), graph_pipeline())
         else:
-            return "Unknown search mode!"
+            text_docs = await text_pipeline()
+            if not text_docs:
+                return "文本中未找到相关信息"
 
         if not text_docs and (not graph_context or "未找到" in graph_context):
             return "文本和知识图谱中均未找到相关信息"
 
-        return self.generator.generate(query, text_docs, graph_context)
\ No newline at end of file
+        return await self.generator.agenerate(query, text_docs, graph_context)
+
+    async def aclose(self):
+        """
+        关闭当前事件循环中创建的异步客户端：LLM 客户端、嵌入的 aio 客户端和 Neo4j 异步驱动。
+        每个调用过 aquery 的事件循环结束前都要调用一次，例如：
+            async def main():
+                try:
+                    return await rag.aquery(question)
+                finally:
+                    await rag.aclose()
+        """
+        client = self._async_llm_client.pop()
+        if client is not None:
+            await client.close()
+        if self._embedder.created:
+            await self.embedder.aclose()
+        if self._neo.created:
+            await self.neo.aclose()
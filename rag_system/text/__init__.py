@@ -3,15 +3,23 @@
 提供向量检索、关键词检索、查询扩展和重排序功能
 """
 
-from .query_expander import QueryExpander
-from .multiquery_generator import MultiqueryGenerator
-from .retriever import Retriever
-from .reranker import Reranker
+from ..utils.lazy import lazy_exports
+
+# sentence-transformers / onnxruntime 在 Reranker 加载模型时才导入
+_EXPORTS = {
+    'QueryExpander': '.query_expander',
+    'MultiqueryGenerator': '.multiquery_generator',
+    'Retriever': '.retriever',
+    'Reranker': '.reranker',
+    'RerankScheduler': '.rerank_scheduler',
+}
 
 __all__ = [
     'QueryExpander',
     'MultiqueryGenerator',
     'Retriever',
     'Reranker',
+    'RerankScheduler',
 ]
 
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -1,6 +1,11 @@
+import asyncio
 from typing import List
 
 class QueryExpander:
     """抽象接口：定义扩展查询的能力"""
     def expand(self, query: str, num_queries: int) -> List[str]:
         raise NotImplementedError
+
+    async def aexpand(self, query: str, num_queries: int) -> List[str]:
+        """默认在线程中调用同步实现"""
+        return await asyncio.to_thread(self.expand, query, num_queries)
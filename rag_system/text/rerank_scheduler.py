@@ -0,0 +1,157 @@
+"""
+重排微批调度器
+把多个并发调用方提交的 (query, doc) 对在很短的时间窗口内汇集起来，凑成一个大批次
+统一做一次交叉编码器前向，再把分数分发回各自的调用方。
+接口与 Reranker 一致，可以直接替换（级联重排的提前退出不适用于微批）。
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+
+from .reranker import Reranker
+
+
+class _Request:
+    __slots__ = ("pairs", "future", "enqueued")
+
+    def __init__(self, pairs: List[Tuple[str, str]]):
+        self.pairs = pairs
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class RerankScheduler:
+    """并发调用方共享的重排微批调度器"""
+
+    def __init__(self, reranker: Reranker, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        """
+        :param reranker: 实际执行打分的 Reranker
+        :param max_batch_size: 单次前向最多汇集的 (query, doc) 对数（单个请求超过时独占一批）
+        :param max_wait_ms: 收到第一个请求后最多等待多久再开始前向
+        """
+        self.reranker = reranker
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending_pairs = 0
+        self.batches = 0
+        self.pairs_scored = 0
+        self.largest_batch = 0
+        self._total_wait = 0.0
+        self._requests = 0
+        self._closed = False
+        self._carry: _Request | None = None  # 放不进上一批的请求，作为下一批的第一个（只由后台线程访问）
+        self._worker = threading.Thread(target=self._loop, name="rerank-scheduler", daemon=True)
+        self._worker.start()
+
+    # ================= 调用方接口 =================
+
+    def score_pairs(self, pairs) -> List[float]:
+        """提交一组 (query, doc) 对，阻塞直到所在批次打分完成"""
+        if not pairs:
+            return []
+        request = _Request(list(pairs))
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("RerankScheduler 已关闭")
+            self._pending_pairs += len(request.pairs)
+            self._queue.put(request)
+        return request.future.result()
+
+    def rerank(self, query, docs, top_n=3):
+        return self.rerank_batch([query], [docs], top_n)[0]
+
+    def rerank_batch(self, queries, doc_lists, top_n=3):
+        # 级联的第一阶段在调用方线程完成，微批只汇集交叉编码器的打分
+        doc_lists = self.reranker.prune(queries, doc_lists)
+        pairs = [(query, doc) for query, docs in zip(queries, doc_lists) for doc in docs]
+        if not pairs:
+            return [[] for _ in queries]
+        return Reranker.split_top_n(doc_lists, self.score_pairs(pairs), top_n)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._pending_pairs,
+                "batches": self.batches,
+                "pairs_scored": self.pairs_scored,
+                "mean_batch_size": self.pairs_scored / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "mean_wait_ms": self._total_wait / self._requests * 1000 if self._requests else 0.0,
+            }
+
+    def close(self):
+        """停止后台线程：已被后台线程取出的请求会打分完成，仍在排队的请求以 RuntimeError 失败，之后的提交直接抛出"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            while True:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._pending_pairs -= len(request.pairs)
+                request.future.set_exception(RuntimeError("RerankScheduler 已关闭"))
+            self._queue.put(None)
+        self._worker.join()
+
+    # ================= 后台线程 =================
+
+    def _collect(self, first: _Request) -> Tuple[List[_Request], bool]:
+        """从第一个请求开始，在时间窗口和批大小限制内继续汇集请求；加入后会超过批大小的请求留到下一批"""
+        batch, size = [first], len(first.pairs)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            if size + len(request.pairs) > self.max_batch_size:
+                self._carry = request
+                break
+            batch.append(request)
+            size += len(request.pairs)
+        return batch, False
+
+    def _loop(self):
+        stop = False
+        while True:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            elif stop:
+                break
+            else:
+                first = self._queue.get()
+                if first is None:
+                    break
+            batch, sentinel = self._collect(first)
+            stop = stop or sentinel
+            pairs = [pair for request in batch for pair in request.pairs]
+            started = time.monotonic()
+            with self._lock:
+                self._pending_pairs -= len(pairs)
+                self.batches += 1
+                self.pairs_scored += len(pairs)
+                self.largest_batch = max(self.largest_batch, len(pairs))
+                self._requests += len(batch)
+                self._total_wait += sum(started - request.enqueued for request in batch)
+            try:
+                # 每次前向最多 max_batch_size 对：独占一批的超大请求也会被切开，避免显存和延迟失控
+                scores = self.reranker.score_pairs(pairs, batch_size=self.max_batch_size)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            offset = 0
+            for request in batch:
+                request.future.set_result(scores[offset:offset + len(request.pairs)])
+                offset += len(request.pairs)
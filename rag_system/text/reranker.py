@@ -1,11 +1,184 @@
-from sentence_transformers import CrossEncoder
+from pathlib import Path
+
+
+def load_onnx_cross_encoder(model_name, onnx_dir, threads=None, max_length=None, quantization="avx512_vnni"):
+    """
+    加载 int8 动态量化的 ONNX 交叉编码器。
+    首次调用时把模型导出为 ONNX 并量化，保存在 onnx_dir/<模型名> 下，之后直接读取缓存。
+    :param threads: onnxruntime 的 intra-op 线程数，None 表示使用 onnxruntime 默认值
+    :param quantization: 量化指令集配置：arm64 / avx2 / avx512 / avx512_vnni
+    """
+    import onnxruntime as ort
+    from sentence_transformers import CrossEncoder
+    from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+    export_dir = Path(onnx_dir) / model_name.replace("/", "_").replace("\\", "_").strip("._")
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not (export_dir / file_name).exists():
+        print(f"[ONNX重排] 首次使用，正在导出并量化 {model_name} → {export_dir}")
+        model = CrossEncoder(model_name, backend="onnx", max_length=max_length)
+        model.save_pretrained(str(export_dir))
+        export_dynamic_quantized_onnx_model(model, quantization, str(export_dir))
+
+    session_options = ort.SessionOptions()
+    if threads:
+        session_options.intra_op_num_threads = threads
+    return CrossEncoder(
+        str(export_dir),
+        backend="onnx",
+        max_length=max_length,
+        model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider",
+                      "session_options": session_options},
+    )
+
 
 class Reranker:
-    def __init__(self, model_name):
-        self.model = CrossEncoder(model_name)
+    def __init__(self, model_name, batch_size=32, candidate_budget=None, first_stage_model=None,
+                 early_exit_patience=None, backend="torch", onnx_dir="./onnx_models", threads=None,
+                 max_length=None, onnx_quantization="avx512_vnni"):
+        """
+        :param batch_size: 交叉编码器单次前向的 (query, doc) 对数
+        :param candidate_budget: 级联重排：交叉编码器最多打分的候选数，None 表示全部打分
+        :param first_stage_model: 级联第一阶段的小型交叉编码器；None 时直接沿用输入顺序（RRF 融合分数的排序）
+        :param early_exit_patience: 按第一阶段顺序逐批打分，连续这么多批 top_n 不变时提前停止；None 表示不提前退出
+        :param backend: torch（全精度 PyTorch）或 onnx（int8 量化的 ONNX Runtime，导出失败时回退到 torch）
+        :param onnx_dir: ONNX 导出产物的缓存目录
+        :param threads: ONNX 推理的 intra-op 线程数
+        :param max_length: 输入截断长度，None 表示使用模型默认值
+        :param onnx_quantization: ONNX 量化配置（arm64 / avx2 / avx512 / avx512_vnni）
+        """
+        self.backend = backend
+        self.onnx_dir = onnx_dir
+        self.threads = threads
+        self.max_length = max_length
+        self.onnx_quantization = onnx_quantization
+        self.model = self._load_model(model_name)
+        self.first_stage_model = self._load_model(first_stage_model) if first_stage_model else None
+        self.batch_size = batch_size
+        self.candidate_budget = candidate_budget
+        self.early_exit_patience = early_exit_patience
+        self.pairs_scored = 0  # 交叉编码器累计打分的 (query, doc) 对数
+
+    def _load_model(self, model_name):
+        from sentence_transformers import CrossEncoder
+        if self.backend == "onnx":
+            try:
+                return load_onnx_cross_encoder(model_name, self.onnx_dir, threads=self.threads,
+                                               max_length=self.max_length, quantization=self.onnx_quantization)
+            except Exception as e:
+                print(f"[ONNX重排] 加载失败，回退到 PyTorch: {e}")
+        elif self.backend != "torch":
+            raise ValueError(f"未知的重排后端: {self.backend}")
+        return CrossEncoder(model_name, max_length=self.max_length)
 
     def rerank(self, query, docs, top_n=3):
-        pairs = [(query, d) for d in docs]
-        scores = self.model.predict(pairs)
-        scored = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
-        return [doc for doc, _ in scored[:top_n]]
\ No newline at end of file
+        if self.early_exit_patience and len(docs) > top_n:
+            return self._rerank_early_exit(query, self.prune([query], [docs])[0], top_n)
+        return self.rerank_batch([query], [docs], top_n)[0]
+
+    def rerank_batch(self, queries, doc_lists, top_n=3):
+        """把多个查询的全部 (query, doc) 对合并成一次打分，再按查询拆分回各自的 top_n"""
+        doc_lists = self.prune(queries, doc_lists)
+        pairs = [(query, doc) for query, docs in zip(queries, doc_lists) for doc in docs]
+        if not pairs:
+            return [[] for _ in queries]
+        return self.split_top_n(doc_lists, self.score_pairs(pairs), top_n)
+
+    def prune(self, queries, doc_lists):
+        """级联第一阶段：每个查询只保留 candidate_budget 个候选，按第一阶段分数排序"""
+        budget = self.candidate_budget
+        if not budget or all(len(docs) <= budget for docs in doc_lists):
+            return doc_lists
+        if self.first_stage_model is None:
+            return [docs[:budget] for docs in doc_lists]
+
+        todo = [i for i, docs in enumerate(doc_lists) if len(docs) > budget]
+        pairs = [(queries[i], doc) for i in todo for doc in doc_lists[i]]
+        pruned = list(doc_lists)
+        cheap = self.split_top_n([doc_lists[i] for i in todo],
+                                 self.score_pairs(pairs, model=self.first_stage_model), budget)
+        for i, docs in zip(todo, cheap):
+            pruned[i] = docs
+        return pruned
+
+    def _rerank_early_exit(self, query, docs, top_n):
+        """按第一阶段顺序分批打分，top_n 连续 early_exit_patience 批不变时停止"""
+        scored, top, stable = [], None, 0
+        for start in range(0, len(docs), self.batch_size):
+            chunk = docs[start:start + self.batch_size]
+            scored.extend(zip(chunk, self.score_pairs([(query, doc) for doc in chunk])))
+            new_top = [doc for doc, _ in sorted(scored, key=lambda x: x[1], reverse=True)[:top_n]]
+            stable = stable + 1 if new_top == top else 0
+            top = new_top
+            if stable >= self.early_exit_patience:
+                break
+        return top
+
+    def score_pairs(self, pairs, model=None, batch_size: int | None = None):
+        """
+        对 (query, doc) 对打分，按长度排序后分批前向以减少 padding，返回与输入顺序一致的分数
+        :param batch_size: 单次前向的对数，None 表示使用 self.batch_size
+        """
+        if not pairs:
+            return []
+        if model is None:
+            model = self.model
+            self.pairs_scored += len(pairs)
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]), reverse=True)
+        sorted_scores = model.predict([pairs[i] for i in order], batch_size=batch_size or self.batch_size,
+                                      show_progress_bar=False)
+        scores = [0.0] * len(pairs)
+        for i, score in zip(order, sorted_scores):
+            scores[i] = float(score)
+        return scores
+
+    @staticmethod
+    def split_top_n(doc_lists, scores, top_n):
+        """把扁平的分数按查询拆分，各取 top_n"""
+        results, offset = [], 0
+        for docs in doc_lists:
+            scored = sorted(zip(docs, scores[offset:offset + len(docs)]), key=lambda x: x[1], reverse=True)
+            results.append([doc for doc, _ in scored[:top_n]])
+            offset += len(docs)
+        return results
+
+    def evaluate_cascade(self, queries, doc_lists, top_n=3) -> dict:
+        """
+        评估级联重排相对全量重排的质量损失和打分开销。
+        全量结果对全部候选打分；级联结果走当前配置的 rerank。
+        """
+        pairs = [(query, doc) for query, docs in zip(queries, doc_lists) for doc in docs]
+        full = self.split_top_n(doc_lists, self.score_pairs(pairs), top_n)
+        before = self.pairs_scored
+        cascade = [self.rerank(query, docs, top_n) for query, docs in zip(queries, doc_lists)]
+        cascade_pairs = self.pairs_scored - before
+
+        overlaps = [len(set(a) & set(b)) / len(b) for a, b in zip(cascade, full) if b]
+        report = {
+            "queries": len(overlaps),
+            "top_n": top_n,
+            "overlap": sum(overlaps) / len(overlaps) if overlaps else 0.0,
+            "exact_match": sum(a == b for a, b in zip(cascade, full) if b) / len(overlaps) if overlaps else 0.0,
+            "pairs_full": len(pairs),
+            "pairs_cascade": cascade_pairs,
+            "cost_ratio": cascade_pairs / len(pairs) if pairs else 0.0,
+        }
+        print(f"[级联重排评估] top{top_n} 重合率 {report['overlap']:.4f}，完全一致 {report['exact_match']:.4f}，"
+              f"打分开销 {report['pairs_cascade']}/{report['pairs_full']}（{report['cost_ratio']:.2%}）")
+        return report
+
+    def agreement(self, other: "Reranker", queries, doc_lists, top_n=3) -> dict:
+        """比较两个重排器（如 ONNX int8 与 PyTorch 全精度）在同一批候选上的 top_n 排序是否一致"""
+        pairs = [(query, doc) for query, docs in zip(queries, doc_lists) for doc in docs]
+        mine = self.split_top_n(doc_lists, self.score_pairs(pairs), top_n)
+        theirs = other.split_top_n(doc_lists, other.score_pairs(pairs), top_n)
+        judged = [(a, b) for a, b in zip(mine, theirs) if b]
+        report = {
+            "queries": len(judged),
+            "top_n": top_n,
+            "identical_ranking": sum(a == b for a, b in judged) / len(judged) if judged else 0.0,
+            "overlap": sum(len(set(a) & set(b)) / len(b) for a, b in judged) / len(judged) if judged else 0.0,
+        }
+        print(f"[重排一致性] top{top_n} 排序完全一致 {report['identical_ranking']:.4f}，"
+              f"重合率 {report['overlap']:.4f}（{report['queries']} 个查询）")
+        return report
@@ -1,13 +1,116 @@
-from ..utils.smart_tokenize import smart_tokenize
-from typing import List
+import asyncio
+import heapq
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, List, Tuple
 from .query_expander import QueryExpander
+from ..core.hits import Hit, texts_of
+from ..utils.lazy import resolve
 
 class Retriever:
-    def __init__(self, db, embedder, query_expander: QueryExpander=None, verbose=True):
+    def __init__(self, db, embedder, query_expander: QueryExpander=None, verbose=True,
+                 executor: Executor | None = None, leg_timeout: float | None = None,
+                 fusion_weights: Dict[str, float] | None = None, rrf_k: int = 60, max_abandoned: int = 1):
+        """
+        :param executor: 并行执行各检索分支（向量/关键词）的线程池，None 时自动创建
+        :param leg_timeout: 单次检索中各分支共享的截止时间（秒），超时的分支结果被丢弃，None 表示一直等待
+        :param max_abandoned: 每个分支最多允许多少个超时后仍在线程池里运行的调用；达到上限时该分支直接降级，
+                              不再提交新任务，避免卡住的分支占满线程池
+        :param fusion_weights: 融合时各分支（vector / keyword）的权重，未列出的分支权重为 1
+        :param rrf_k: RRF 的平滑参数
+        embedder 和 query_expander 也可以是 Lazy 对象，第一次用到时才创建（只做关键词检索时不会创建）
+        """
         self.db = db
         self.verbose = verbose
-        self.query_expander = query_expander
-        self.embedder = embedder
+        self._query_expander = query_expander
+        self._embedder = embedder
+        self.executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+        self.leg_timeout = leg_timeout
+        self.max_abandoned = max_abandoned
+        self._abandoned: Dict[str, int] = {}  # 分支名 -> 超时但仍在运行的调用数
+        self._abandoned_lock = threading.Lock()
+        self.fusion_weights = fusion_weights or {}
+        self.rrf_k = rrf_k
+
+    @property
+    def embedder(self):
+        return resolve(self._embedder)
+
+    @property
+    def query_expander(self):
+        return resolve(self._query_expander)
+
+    def _run_legs(self, legs: Dict[str, Callable], empty):
+        """
+        并行执行相互独立的检索分支，返回 {分支名: 结果}。
+        超过截止时间或出错的分支以 empty 代替，只有全部分支出错时才抛出异常。
+        线程池里的任务无法中途取消，超时的调用会继续占用线程直到返回；
+        同一分支积压的超时调用达到 max_abandoned 时，该分支直接降级，等积压的调用返回后再恢复。
+        """
+        futures, results = {}, {}
+        for name, fn in legs.items():
+            with self._abandoned_lock:
+                saturated = self._abandoned.get(name, 0) >= self.max_abandoned
+            if saturated:
+                if self.verbose:
+                    print(f"[检索降级] {name} 分支仍有超时调用未返回，跳过")
+                results[name] = empty
+            else:
+                futures[name] = self.executor.submit(fn)
+        deadline = None if self.leg_timeout is None else time.monotonic() + self.leg_timeout
+        errors = []
+        for name, future in futures.items():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                if not future.cancel():
+                    self._abandon(name, future)
+                if self.verbose:
+                    print(f"[检索降级] {name} 分支超过 {self.leg_timeout}s 未返回，跳过")
+                results[name] = empty
+            except Exception as e:
+                if self.verbose:
+                    print(f"[检索降级] {name} 分支出错: {e}")
+                errors.append(e)
+                results[name] = empty
+        if errors and len(errors) == len(futures):
+            raise errors[0]
+        return {name: results[name] for name in legs}
+
+    def _abandon(self, name: str, future):
+        """记录一个超时但仍在运行的分支调用，调用结束时自动释放计数"""
+        with self._abandoned_lock:
+            self._abandoned[name] = self._abandoned.get(name, 0) + 1
+
+        def release(_):
+            with self._abandoned_lock:
+                self._abandoned[name] -= 1
+
+        future.add_done_callback(release)
+
+    async def _arun_legs(self, legs: Dict[str, Awaitable], empty):
+        """_run_legs 的协程版本，超时的分支被取消"""
+        tasks = {name: asyncio.ensure_future(leg) for name, leg in legs.items()}
+        _, pending = await asyncio.wait(tasks.values(), timeout=self.leg_timeout)
+        results, errors = {}, []
+        for name, task in tasks.items():
+            if task in pending:
+                task.cancel()
+                if self.verbose:
+                    print(f"[检索降级] {name} 分支超过 {self.leg_timeout}s 未返回，跳过")
+                results[name] = empty
+            elif task.exception() is not None:
+                if self.verbose:
+                    print(f"[检索降级] {name} 分支出错: {task.exception()}")
+                errors.append(task.exception())
+                results[name] = empty
+            else:
+                results[name] = task.result()
+        if errors and len(errors) == len(tasks):
+            raise errors[0]
+        return results
 
     @staticmethod
     def reciprocal_rank_fusion(search_res: List[List[str]], k: int = 60) -> List[str]:
@@ -16,6 +119,7 @@ class Retriever:
         :param search_res: 一个包含多个检索结果列表的列表。
         :param k: RRF算法中的平滑参数。
         :return: 融合并重新排序后的文档列表。
+        以文本为键；检索流程内部使用基于 id 的 fuse。
         """
         fused_scores = {}
         for doc_list in search_res:
@@ -26,32 +130,64 @@ class Retriever:
         reranked_res = sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)
         return [doc for doc, _ in reranked_res]
 
-    def vector_search(self, query, k=5, source_filter=None):
-        embedding = self.embedder.embed([query], task_type="RETRIEVAL_QUERY")[0]
-        results = self.db.collection.query(
-            query_embeddings=embedding,
-            n_results=k,
-            where={"source": source_filter} if source_filter else None
-        )
-        return results["documents"][0]
-
-    def keyword_search(self, query, k=5, language="auto"):
+    def fuse(self, legs: List[Tuple[str, List[Hit]]], top_k: int | None = None) -> List[Hit]:
+        """
+        在 chunk id 上做加权 RRF 融合，保留每条命中在各分支的名次和原始分数。
+        :param legs: [(分支名, 按相关度排序的命中列表)]，分支权重取自 fusion_weights（默认 1）
+        :param top_k: 只保留融合分数最高的 top_k 条，None 表示全部保留
+        """
+        fused: Dict[str, Hit] = {}
+        for leg, hits in legs:
+            weight = self.fusion_weights.get(leg, 1.0)
+            for rank, hit in enumerate(hits):
+                entry = fused.get(hit.id)
+                if entry is None:
+                    entry = fused[hit.id] = Hit(hit.id, hit.source, text=hit.text)
+                entry.score += weight / (rank + self.rrf_k)
+                entry.ranks[leg] = rank
+                entry.scores[leg] = hit.score
+        if top_k:
+            return heapq.nlargest(top_k, fused.values(), key=lambda h: h.score)
+        return sorted(fused.values(), key=lambda h: h.score, reverse=True)
+
+    # ================= 命中记录（id + 分数，不含文本） =================
+
+    def vector_hits_batch(self, queries, k=5, source_filter=None) -> List[List[Hit]]:
+        """一次嵌入调用 + 一次多查询向量检索"""
+        embeddings = self.embedder.embed(queries, task_type="RETRIEVAL_QUERY")
+        return self.db.vector_search_hits(embeddings, k, source_filter)
+
+    async def avector_hits_batch(self, queries, k=5, source_filter=None) -> List[List[Hit]]:
+        """嵌入走异步客户端，向量检索（本地计算）放到线程里"""
+        embeddings = await self.embedder.aembed(queries, task_type="RETRIEVAL_QUERY")
+        return await asyncio.to_thread(self.db.vector_search_hits, embeddings, k, source_filter)
+
+    def keyword_hits_batch(self, queries, k=5, language="auto", source_filter=None) -> List[List[Hit]]:
+        """一次性对所有查询做 BM25 打分"""
         if not self.db.bm25_index:
-            return []
-        tokens = smart_tokenize(query, language)# 对查询进行分词
-        if not tokens:
-            return []
-        # 获取BM25分数
-        scores = self.db.bm25_index.get_scores(tokens)
-        top_idx = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
-        return [self.db.bm25_corpus[i] for i in top_idx]
+            return [[] for _ in queries]
+        return self.db.bm25_index.search_hits_batch(queries, k, language, source_filter=source_filter)
 
-    def text_hybrid_search(self, query, k=5, source_filter=None):
-        v = self.vector_search(query, k, source_filter)
-        bm = self.keyword_search(query, k)
-        return self.reciprocal_rank_fusion([v, bm])  # RRF fusion
+    def hybrid_hits_batch(self, queries, k=5, source_filter=None, top_k=None) -> List[List[Hit]]:
+        """多个查询一起做混合检索：一次嵌入调用、一轮 BM25 打分，再逐个查询融合"""
+        # 向量分支主要在等网络，关键词分支在算 BM25，二者并行
+        empty = [[] for _ in queries]
+        legs = self._run_legs({
+            "vector": lambda: self.vector_hits_batch(queries, k, source_filter),
+            "keyword": lambda: self.keyword_hits_batch(queries, k, source_filter=source_filter),
+        }, empty=empty)
+        return [self.fuse([("vector", vector_hits), ("keyword", keyword_hits)], top_k)
+                for vector_hits, keyword_hits in zip(legs["vector"], legs["keyword"])]
 
-    def expand_search(self, query, k=5, num_queries=3, source_filter=None):
+    async def ahybrid_hits(self, query, k=5, source_filter=None, top_k=None) -> List[Hit]:
+        """hybrid_hits_batch 单个查询的协程版本"""
+        legs = await self._arun_legs({
+            "vector": self.avector_hits_batch([query], k, source_filter),
+            "keyword": asyncio.to_thread(self.keyword_hits_batch, [query], k, "auto", source_filter),
+        }, empty=[[]])
+        return self.fuse([("vector", legs["vector"][0]), ("keyword", legs["keyword"][0])], top_k)
+
+    def expand_hits(self, query, k=5, num_queries=3, source_filter=None, top_k=None) -> List[Hit]:
         """
         :param query: 原始查询
         :param k: 控制单个搜索方案的返回结果数量
@@ -60,12 +196,57 @@ class Retriever:
         if not self.query_expander:
             raise ValueError("fusion_search requires a QueryExpander")
         queries = [query] + self.query_expander.expand(query, num_queries)
-        all_retrieved_docs = []
-        for q in queries:
-            vector_res = self.vector_search(q, k, source_filter)
-            keyword_res = self.keyword_search(q, k)
-            hybrid_res = self.reciprocal_rank_fusion([vector_res, keyword_res])
-            all_retrieved_docs.append(hybrid_res)
+        # 所有查询合并成一次嵌入调用、一次向量检索和一轮 BM25 打分，每个查询先各自融合，再跨查询融合
+        per_query = self.hybrid_hits_batch(queries, k, source_filter)
+        return self.fuse([(f"query{i}", hits) for i, hits in enumerate(per_query)], top_k)
+
+    def search_hits_batch(self, queries, mode="text_hybrid", k=5, source_filter=None, top_k=None):
+        """按检索模式（vector / keyword / expand / text_hybrid）批量返回命中记录"""
+        if mode == "vector":
+            hit_lists = self.vector_hits_batch(queries, k, source_filter)
+        elif mode == "keyword":
+            hit_lists = self.keyword_hits_batch(queries, k, source_filter=source_filter)
+        elif mode == "expand":
+            return [self.expand_hits(query, k, source_filter=source_filter, top_k=top_k) for query in queries]
+        else:
+            return self.hybrid_hits_batch(queries, k, source_filter, top_k)
+        return [hits[:top_k] if top_k else hits for hits in hit_lists]
+
+    def fetch_texts(self, hit_lists: List[List[Hit]]) -> List[List[Hit]]:
+        """为命中记录取回文本（一次数据库调用）"""
+        return self.db.attach_texts(hit_lists)
+
+    # ================= 文本接口 =================
+
+    def texts(self, hit_lists: List[List[Hit]]) -> List[List[str]]:
+        return [texts_of(hits) for hits in self.fetch_texts(hit_lists)]
+
+    def vector_search(self, query, k=5, source_filter=None):
+        return self.vector_search_batch([query], k, source_filter)[0]
 
-        return self.reciprocal_rank_fusion(all_retrieved_docs)
+    def vector_search_batch(self, queries, k=5, source_filter=None):
+        return self.texts(self.vector_hits_batch(queries, k, source_filter))
 
+    async def avector_search_batch(self, queries, k=5, source_filter=None):
+        hit_lists = await self.avector_hits_batch(queries, k, source_filter)
+        return await asyncio.to_thread(self.texts, hit_lists)
+
+    def keyword_search(self, query, k=5, language="auto", source_filter=None):
+        return self.keyword_search_batch([query], k, language, source_filter)[0]
+
+    def keyword_search_batch(self, queries, k=5, language="auto", source_filter=None):
+        return self.texts(self.keyword_hits_batch(queries, k, language, source_filter))
+
+    def text_hybrid_search(self, query, k=5, source_filter=None):
+        return self.text_hybrid_search_batch([query], k, source_filter)[0]
+
+    def text_hybrid_search_batch(self, queries, k=5, source_filter=None):
+        return self.texts(self.hybrid_hits_batch(queries, k, source_filter))
+
+    async def atext_hybrid_search(self, query, k=5, source_filter=None):
+        """text_hybrid_search 的协程版本"""
+        hits = await self.ahybrid_hits(query, k, source_filter)
+        return (await asyncio.to_thread(self.texts, [hits]))[0]
+
+    def expand_search(self, query, k=5, num_queries=3, source_filter=None):
+        return self.texts([self.expand_hits(query, k, num_queries, source_filter)])[0]
@@ -3,11 +3,29 @@
 提供文本处理和分词功能
 """
 
-from .text_utils import TextProcessor
+from .lazy import lazy_exports
+# 与子模块同名的导出必须立即导入，否则子模块被导入后包属性会指向模块本身
 from .smart_tokenize import smart_tokenize
 
+_EXPORTS = {
+    'TextProcessor': '.text_utils',
+    'BatchTokenizer': '.smart_tokenize',
+    'TokenVocabulary': '.smart_tokenize',
+    'TokenBucket': '.rate_limit',
+    'call_with_backoff': '.rate_limit',
+    'Lazy': '.lazy',
+    'import_time_report': '.import_report',
+}
+
 __all__ = [
     'TextProcessor',
     'smart_tokenize',
+    'BatchTokenizer',
+    'TokenVocabulary',
+    'TokenBucket',
+    'call_with_backoff',
+    'Lazy',
+    'import_time_report',
 ]
 
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
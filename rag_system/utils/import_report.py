@@ -0,0 +1,54 @@
+"""
+导入耗时报告
+在独立子进程中用 `python -X importtime` 导入目标模块，统计总耗时和各个第三方依赖包的累计耗时，
+用来检查 CLI / 关键词检索 worker 的启动是否被重量级依赖拖慢。
+"""
+import subprocess
+import sys
+from typing import Dict
+
+
+def import_time_report(module: str = "rag_system", top: int = 15, python: str = sys.executable,
+                       verbose: bool = True) -> Dict:
+    """
+    :param module: 要导入的模块（也可以是 "rag_system.rag_system" 这样的子模块）
+    :param top: 报告中列出的最慢依赖包个数
+    :return: {"module", "total_ms", "packages": [(包名, 累计毫秒), ...]}
+    """
+    proc = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr.strip().splitlines()[-1]}")
+
+    total_us = 0
+    packages: Dict[str, int] = {}
+    own_root = module.split(".")[0]
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name, cumulative = name.strip(), int(cumulative)
+        if name == module:
+            total_us = cumulative
+        root = name.split(".")[0]
+        # 同一个包最外层那次导入的累计耗时最大，代表加载整个包的代价；标准库不计入
+        if root in sys.stdlib_module_names or root.startswith("_") or root == own_root:
+            continue
+        if cumulative > packages.get(root, 0):
+            packages[root] = cumulative
+
+    slowest = sorted(packages.items(), key=lambda x: x[1], reverse=True)[:top]
+    report = {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "packages": [(name, us / 1000) for name, us in slowest],
+    }
+    if verbose:
+        print(f"[导入耗时] import {module}: {report['total_ms']:.1f} ms")
+        for name, ms in report["packages"]:
+            print(f"   - {name:<28} {ms:8.1f} ms")
+    return report
+
+
+if __name__ == "__main__":
+    import_time_report(*sys.argv[1:2])
@@ -0,0 +1,88 @@
+"""
+延迟加载工具
+- Lazy：首次使用时才创建的组件（线程安全）
+- LoopLocal：每个事件循环各自创建一份的异步客户端
+- lazy_exports：包级别的延迟导出，访问属性时才导入对应子模块
+"""
+import asyncio
+import importlib
+import threading
+import weakref
+from typing import Callable, Dict
+
+
+class Lazy:
+    """包装一个工厂函数，首次调用 get() 时才创建对象，之后一直返回同一个实例"""
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._value = None
+        self._created = False
+        self._lock = threading.Lock()
+
+    @property
+    def created(self) -> bool:
+        return self._created
+
+    def get(self):
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    self._value = self._factory()
+                    self._created = True
+        return self._value
+
+
+class LoopLocal:
+    """
+    按当前运行的事件循环缓存工厂函数的结果。
+    异步驱动/客户端绑定创建时的事件循环，多次 asyncio.run 之间不能共用。
+    实例持有的连接池不会自动关闭（实例还可能反向引用事件循环，使其无法被回收），
+    使用方要在事件循环结束前 pop() 出实例并关闭。
+    """
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._instances = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def created(self) -> bool:
+        return len(self._instances) > 0
+
+    def get(self):
+        """必须在协程中调用"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            value = self._instances.get(loop)
+            if value is None:
+                value = self._instances[loop] = self._factory()
+        return value
+
+    def pop(self):
+        """取出并移除当前事件循环的实例（用于关闭），不存在时返回 None"""
+        with self._lock:
+            return self._instances.pop(asyncio.get_running_loop(), None)
+
+
+def resolve(value):
+    """Lazy / LoopLocal 对象返回其实例，其他值原样返回"""
+    return value.get() if isinstance(value, (Lazy, LoopLocal)) else value
+
+
+def lazy_exports(package: str, exports: Dict[str, str]):
+    """
+    生成包的 __getattr__ / __dir__：访问导出名时才导入子模块。
+    :param exports: {导出名: 相对子模块名}，例如 {'RAGConfig': '.config'}
+    """
+    def __getattr__(name):
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(exports[name], package), name)
+        setattr(importlib.import_module(package), name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(exports) | set(importlib.import_module(package).__dict__))
+
+    return __getattr__, __dir__
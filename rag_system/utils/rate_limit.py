@@ -0,0 +1,80 @@
+"""
+限流与重试工具
+令牌桶限制请求速率，指数退避处理限流/临时性错误
+"""
+import asyncio
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """线程安全的令牌桶：每秒补充 rate 个令牌，最多积攒 capacity 个"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate 必须大于 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """阻塞直到取得足够的令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """判断是否为限流或服务端临时错误（兼容 google-genai 与 openai 的异常）"""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in (429, 500, 502, 503, 504):
+        return True
+    message = str(error)
+    return "RESOURCE_EXHAUSTED" in message or "UNAVAILABLE" in message or "429" in message
+
+
+def call_with_backoff(fn, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 30.0,
+                      rate_limiter: TokenBucket | None = None, verbose: bool = True):
+    """
+    调用 fn()，遇到可重试错误时按指数退避（带抖动）重试。
+    :param rate_limiter: 每次尝试前先从令牌桶取令牌
+    """
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            if verbose:
+                print(f"[限流重试] 第 {attempt + 1}/{max_retries} 次重试，{delay:.1f}s 后继续: {e}")
+            time.sleep(delay)
+
+
+async def acall_with_backoff(fn, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 30.0,
+                             rate_limiter: TokenBucket | None = None, verbose: bool = True):
+    """call_with_backoff 的协程版本，fn() 返回 awaitable"""
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            await asyncio.to_thread(rate_limiter.acquire)
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            if verbose:
+                print(f"[限流重试] 第 {attempt + 1}/{max_retries} 次重试，{delay:.1f}s 后继续: {e}")
+            await asyncio.sleep(delay)
@@ -1,15 +1,142 @@
+import hashlib
+import os
 import re
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
 warnings.filterwarnings('ignore', category=UserWarning, module='jieba') # 2025.10.7
 
-import jieba  # 之后再导入 jieba
+# jieba 在第一次切分中文时才导入，纯英文/只读索引的进程不需要加载它
+# 预编译正则，避免每次调用重复解析
+_CHINESE_RE = re.compile(r'[\u4e00-\u9fa5]')
+_TOKEN_RE = re.compile(r'[\u4e00-\u9fa5a-zA-Z0-9]+')
+_ASCII_WORD_RE = re.compile(r'[a-zA-Z0-9]+')
 
 def smart_tokenize(text, lang="auto"):
-    has_chinese = bool(re.search(r'[\u4e00-\u9fa5]', text))
+    has_chinese = bool(_CHINESE_RE.search(text))
     if lang == "zh" or (lang == "auto" and has_chinese):
+        import jieba  # 之后再导入 jieba
         tokens = list(jieba.cut(text.lower()))
         tokens = [token.strip() for token in tokens
-                  if len(token.strip()) >= 1 and re.match(r'[\u4e00-\u9fa5a-zA-Z0-9]+', token)] # 这里>=1，暂且全部添加
+                  if len(token.strip()) >= 1 and _TOKEN_RE.match(token)] # 这里>=1，暂且全部添加
     else:
-        tokens = re.findall(r'[a-zA-Z0-9]+', text.lower())
-    return tokens
\ No newline at end of file
+        tokens = _ASCII_WORD_RE.findall(text.lower())
+    return tokens
+
+
+def _init_worker():
+    """进程池初始化：每个 worker 只加载一次 jieba 词典"""
+    warnings.filterwarnings('ignore', category=UserWarning, module='jieba')
+    import jieba
+    jieba.initialize()
+
+
+def _tokenize_many(args):
+    texts, lang = args
+    return [smart_tokenize(text, lang) for text in texts]
+
+
+class TokenVocabulary:
+    """词表：token <-> 整数 id，id 只增不减，保证已发放的 id 始终有效"""
+
+    def __init__(self, terms: List[str] | None = None):
+        self.terms: List[str] = list(terms) if terms else []
+        self.term_ids: Dict[str, int] = {term: i for i, term in enumerate(self.terms)}
+
+    def __len__(self):
+        return len(self.terms)
+
+    def add(self, tokens: List[str]) -> np.ndarray:
+        """把 token 序列编码为 id 数组，遇到新词分配新 id"""
+        ids = np.empty(len(tokens), dtype=np.int32)
+        for i, token in enumerate(tokens):
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                term_id = self.term_ids[token] = len(self.terms)
+                self.terms.append(token)
+            ids[i] = term_id
+        return ids
+
+    def lookup(self, tokens: List[str]) -> List[int]:
+        """编码查询：未登录词直接丢弃（它们对 BM25 分数没有贡献）"""
+        return [self.term_ids[t] for t in tokens if t in self.term_ids]
+
+
+class BatchTokenizer:
+    """
+    批量分词器：
+    - 大批量文本分发到进程池，每个 worker 只加载一次 jieba；
+    - 返回 token id 数组而不是 Python 字符串列表；
+    - 以内容哈希为键缓存结果，未变化的文本不会被重复分词。
+    """
+
+    def __init__(self, vocab: TokenVocabulary | None = None, workers: int | None = None,
+                 parallel_threshold: int = 2000, cache_size: int = 200_000):
+        """
+        :param workers: 进程数，None 表示使用 CPU 核数，1 表示不使用进程池
+        :param parallel_threshold: 未命中缓存的文本数达到该值才启用进程池（进程启动和加载词典有固定开销）
+        :param cache_size: 缓存条目上限，0 表示不缓存
+        """
+        self.vocab = vocab or TokenVocabulary()
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_threshold = parallel_threshold
+        self.cache_size = cache_size
+        self._cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @staticmethod
+    def _cache_key(text: str, lang: str) -> bytes:
+        return hashlib.blake2b(f"{lang}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def tokenize_batch(self, texts: List[str], lang: str = "auto") -> List[np.ndarray]:
+        """批量分词，返回与输入一一对应的 token id 数组"""
+        results: List[np.ndarray | None] = [None] * len(texts)
+        keys = [self._cache_key(text, lang) for text in texts]
+
+        pending: Dict[bytes, List[int]] = {}  # 同一批次内的重复文本只分词一次
+        for i, key in enumerate(keys):
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                results[i] = cached
+                self.cache_hits += 1
+            else:
+                pending.setdefault(key, []).append(i)
+
+        if pending:
+            todo = [texts[positions[0]] for positions in pending.values()]
+            self.cache_misses += len(todo)
+            for positions, tokens in zip(pending.values(), self._tokenize_strings(todo, lang)):
+                ids = self.vocab.add(tokens)
+                ids.flags.writeable = False  # 缓存中的数组会被多处共享
+                for i in positions:
+                    results[i] = ids
+                self._remember(keys[positions[0]], ids)
+        return results
+
+    def encode_query(self, text: str, lang: str = "auto") -> List[int]:
+        """查询分词：只返回词表中已有的 token id（保留重复）"""
+        return self.vocab.lookup(smart_tokenize(text, lang))
+
+    def _tokenize_strings(self, texts: List[str], lang: str) -> List[List[str]]:
+        if self.workers <= 1 or len(texts) < self.parallel_threshold:
+            return [smart_tokenize(text, lang) for text in texts]
+        chunk = max(64, len(texts) // (self.workers * 4))
+        batches = [(texts[i:i + chunk], lang) for i in range(0, len(texts), chunk)]
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool:
+            tokenized = []
+            for part in pool.map(_tokenize_many, batches):
+                tokenized.extend(part)
+        return tokenized
+
+    def _remember(self, key: bytes, ids: np.ndarray):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = ids
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -1,6 +1,4 @@
-import docx
 from pathlib import Path
-from langchain.text_splitter import SpacyTextSplitter, RecursiveCharacterTextSplitter
 from typing import List
 
 class TextProcessor:
@@ -15,6 +13,7 @@ class TextProcessor:
         if ext in [".txt", ".md"]:
             return path.read_text(encoding="utf-8")
         elif ext == ".docx":
+            import docx
             doc = docx.Document(path)
             return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
         else:
@@ -58,6 +57,8 @@ class TextProcessor:
             if chunk_size == 512:
                 chunk_size = 256  # 英文信息密度高，块小点
 
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
         splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,